@@ -1,24 +1,64 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
-from flask_bcrypt import Bcrypt
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, jsonify
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_wtf import FlaskForm
+from flask_wtf.csrf import CSRFProtect
 from wtforms import FileField, SubmitField
 from wtforms.validators import DataRequired
-import sqlite3, os, logging
+from werkzeug.utils import safe_join, secure_filename
+import os, logging
 from datetime import datetime
+from init_db import init_db
+import db
+import storage
+from db import get_db, transaction
+from cache import user_cache, invalidate_user
+import pagination
+import stats
+import audit
+import search
+import passwords
+import archives
+import metrics
+import click
+from pagination import InvalidCursor
+from uploads import uploads_bp
+from downloads import send_stored_file
 
 
 # ------------------ CONFIGURACIÓN GENERAL ------------------
 app = Flask(__name__)
+app.request_class = storage.BlobRequest
 app.secret_key = 'drive_me_local_key'
-bcrypt = Bcrypt(app)
+# bcrypt corre en un pool de procesos acotado (ver passwords.py)
+app.config['BCRYPT_LOG_ROUNDS'] = 12
+passwords.init_app(app)
 
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Cuota de almacenamiento por usuario en bytes (None = sin límite)
+app.config['USER_QUOTA_BYTES'] = None
+# Tamaño máximo de una subida reanudable (/api/uploads)
+app.config['MAX_RESUMABLE_SIZE'] = 50 * 1024 ** 3
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
+# Latencia por endpoint, códigos, bytes y SQL (ver /metrics)
+app.config['METRICS_QUERY_DETAIL'] = True
+app.config['SLOW_QUERY_MS'] = 100
+metrics.init_app(app)
+
+# Conexiones SQLite compartidas (se devuelven al pool al terminar cada petición)
+db.init_app(app)
+
+# Todos los formularios POST llevan csrf_token; la API JSON de subidas
+# reanudables queda exenta
+csrf = CSRFProtect(app)
+csrf.exempt(uploads_bp)
+
+# Subidas reanudables por bloques (/api/uploads)
+app.register_blueprint(uploads_bp)
+
 # ------------------ LOGIN MANAGER ------------------
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -39,17 +79,25 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT id, username, password, role FROM users WHERE id=?", (user_id,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return User(*row)
-    return None
+    # Se ejecuta en cada petición autenticada: primero se busca en el caché
+    key = str(user_id)
+    row = user_cache.get(key)
+    if row is None:
+        c = get_db().cursor()
+        c.execute("SELECT id, username, password, role FROM users WHERE id=?", (user_id,))
+        row = c.fetchone()
+        if row is None:
+            return None
+        row = tuple(row)
+        user_cache.set(key, row)
+    return User(*row)
 
 # ------------------ RUTAS ------------------
 
+def _too_busy(template):
+    flash('Demasiadas solicitudes, intenta de nuevo en unos segundos', 'danger')
+    return render_template(template), 429, {'Retry-After': '1'}
+
 @app.route('/')
 def index():
     return redirect(url_for('login'))
@@ -59,44 +107,63 @@ def index():
 def register():
     if request.method == 'POST':
         username = request.form['username']
-        password = bcrypt.generate_password_hash(request.form['password']).decode('utf-8')
+        try:
+            password = passwords.hash_password(request.form['password'])
+        except passwords.PoolBusy:
+            return _too_busy('register.html')
 
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
+        with transaction() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id FROM users WHERE username=?", (username,))
+            exists = c.fetchone()
+            if not exists:
+                c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, password, 'user'))
+                user_id = c.lastrowid
 
-        c.execute("SELECT id FROM users WHERE username=?", (username,))
-        if c.fetchone():
+        if exists:
             flash('El usuario ya existe', 'danger')
-            conn.close()
             return redirect(url_for('register'))
 
-        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", (username, password, 'user'))
-        conn.commit()
-        conn.close()
-
-        logging.info(f'Nuevo usuario creado: {username}')
+        audit.record('register', f'Nuevo usuario creado: {username}', user_id)
         flash('Usuario creado correctamente', 'success')
         return redirect(url_for('login'))
 
     return render_template('register.html')
 
 # ---------- LOGIN ----------
+def _upgrade_hash(user_id, password):
+    # El factor de trabajo subió desde que se creó el hash: se rehace ahora
+    # que se conoce la contraseña. Si el pool está saturado se deja para después.
+    try:
+        new_hash = passwords.hash_password(password)
+    except passwords.PoolBusy:
+        return
+    with transaction() as conn:
+        conn.execute("UPDATE users SET password=? WHERE id=?", (new_hash, user_id))
+    invalidate_user(user_id)
+    logging.info(f'Hash de contraseña actualizado para el usuario {user_id}')
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
 
-        conn = sqlite3.connect('database.db')
-        c = conn.cursor()
+        c = get_db().cursor()
         c.execute("SELECT id, username, password, role FROM users WHERE username=?", (username,))
         user = c.fetchone()
-        conn.close()
 
-        if user and bcrypt.check_password_hash(user[2], password):
+        try:
+            valid = user is not None and passwords.check_password(user[2], password)
+        except passwords.PoolBusy:
+            return _too_busy('login.html')
+
+        if valid:
+            if passwords.needs_rehash(user[2]):
+                _upgrade_hash(user[0], password)
             user_obj = User(*user)
             login_user(user_obj)
-            logging.info(f'Usuario inició sesión: {username}')
+            audit.record('login', f'Usuario inició sesión: {username}', user_obj.id)
 
             if user_obj.role == 'admin':
                 return redirect(url_for('admin_panel'))
@@ -117,28 +184,69 @@ def dashboard():
         file = form.file.data
         if file:
             filename = file.filename
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            # El cuerpo ya se escribió por bloques a un temporal con su SHA-256
+            spool = file.stream
+            if not isinstance(spool, storage.HashingFile):
+                spool = storage.spool_stream(spool)
+
+            try:
+                file_id = storage.add_file(get_db(), current_user.id, current_user.username, filename, spool,
+                                 datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                 quota=app.config['USER_QUOTA_BYTES'])
+            except stats.QuotaExceeded:
+                flash('No tienes espacio suficiente para subir este archivo', 'danger')
+                return redirect(url_for('dashboard'))
 
-            conn = sqlite3.connect('database.db')
-            c = conn.cursor()
-            c.execute("""
-                INSERT INTO files (filename, user_id, uploaded_by, uploaded_at)
-                VALUES (?, ?, ?, ?)
-            """, (filename, current_user.id, current_user.username, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-            conn.commit()
-            conn.close()
-
-            logging.info(f'Archivo subido: {filename} por {current_user.username}')
+            # La extracción de texto para el buscador corre fuera de la petición
+            search.schedule(file_id, filename, storage.blob_path(spool.hexdigest()))
+            audit.record('upload', f'Archivo subido: {filename} por {current_user.username}', current_user.id)
             flash('Archivo subido correctamente', 'success')
             return redirect(url_for('dashboard'))
 
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("SELECT filename, uploaded_at FROM files WHERE user_id=?", (current_user.id,))
-    files = c.fetchall()
-    conn.close()
+    query = request.args.get('q', '').strip()
+    if query:
+        # Resultados del buscador, ordenados por relevancia
+        files, next_cursor = search.search(get_db(), current_user.id, query), None
+    else:
+        # Solo la primera página; el resto se pide a /api/files con el cursor
+        files, next_cursor = pagination.list_files(get_db(), user_id=current_user.id)
+    usage = stats.user_stats(get_db(), current_user.id)
+
+    return render_template('dashboard.html', files=files, next_cursor=next_cursor, form=form,
+                           usage=usage, quota=app.config['USER_QUOTA_BYTES'], query=query,
+                           title="Mi Unidad", page="inicio")
+
+# ---------- LISTADO PAGINADO (JSON) ----------
+def _file_page(user_id):
+    args = request.args
+    try:
+        rows, next_cursor = pagination.list_files(
+            get_db(),
+            user_id=user_id,
+            cursor=args.get('cursor'),
+            limit=pagination.parse_limit(args.get('limit')),
+            prefix=args.get('prefix'),
+            since=args.get('since'),
+            until=args.get('until'),
+            order=args.get('order', 'desc'),
+        )
+    except InvalidCursor:
+        return jsonify(error='Cursor inválido'), 400
+    return jsonify(items=[pagination.file_to_dict(r) for r in rows], next_cursor=next_cursor)
 
-    return render_template('dashboard.html', files=files, form=form, title="Mi Unidad", page="inicio")
+@app.route('/api/files')
+@login_required
+def api_files():
+    return _file_page(current_user.id)
+
+# ---------- BÚSQUEDA (JSON) ----------
+@app.route('/api/search')
+@login_required
+def api_search():
+    query = request.args.get('q', '')
+    limit = min(pagination.parse_limit(request.args.get('limit')), search.MAX_RESULTS)
+    rows = search.search(get_db(), current_user.id, query, limit=limit)
+    return jsonify(items=[dict(pagination.file_to_dict(r), snippet=r['snippet']) for r in rows])
 
 # ---------- PANEL ADMIN ----------
 @app.route('/admin')
@@ -148,81 +256,256 @@ def admin_panel():
         flash('Acceso denegado. No tienes permisos de administrador.', 'danger')
         return redirect(url_for('dashboard'))
 
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    c = conn.cursor()
+    # Totales (mantenidos por triggers, sin COUNT(*))
+    totals = stats.global_stats(get_db())
 
-    # Totales
-    c.execute("SELECT COUNT(*) FROM users")
-    total_users = c.fetchone()[0]
+    recent_logs = pagination.list_logs(get_db(), limit=20)[0]
 
-    c.execute("SELECT COUNT(*) FROM files")
-    total_files = c.fetchone()[0]
+    # Primera página de usuarios y archivos; el resto se carga desde /admin/api/*
+    users, users_cursor = pagination.list_users(get_db())
+    files, files_cursor = pagination.list_files(get_db())
 
-    # Si tienes logs, puedes contar, si no pon en 0
-    total_logs = 0
+    return render_template(
+        'admin.html',
+        total_users=totals['users'],
+        total_files=totals['files'],
+        total_bytes=totals['total_bytes'],
+        total_logs=totals['logs'],
+        recent_logs=[row['message'] for row in reversed(recent_logs)],
+        users=users,
+        users_cursor=users_cursor,
+        files=files,
+        files_cursor=files_cursor
+    )
 
-    # Usuarios
-    c.execute("SELECT id, username, role FROM users")
-    users = c.fetchall()
+@app.route('/admin/api/files')
+@login_required
+def admin_api_files():
+    if current_user.role != 'admin':
+        return jsonify(error='Acceso denegado'), 403
+
+    owner = request.args.get('owner')
+    user_id = None
+    if owner:
+        c = get_db().cursor()
+        c.execute("SELECT id FROM users WHERE username=?", (owner,))
+        row = c.fetchone()
+        if not row:
+            return jsonify(items=[], next_cursor=None)
+        user_id = row[0]
+    return _file_page(user_id)
+
+@app.route('/admin/api/logs')
+@login_required
+def admin_api_logs():
+    if current_user.role != 'admin':
+        return jsonify(error='Acceso denegado'), 403
+
+    try:
+        rows, next_cursor = pagination.list_logs(
+            get_db(),
+            cursor=request.args.get('cursor'),
+            limit=pagination.parse_limit(request.args.get('limit')),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            action=request.args.get('action'),
+        )
+    except InvalidCursor:
+        return jsonify(error='Cursor inválido'), 400
+    return jsonify(items=[dict(r) for r in rows], next_cursor=next_cursor)
 
-    # Archivos
-    c.execute("""
-        SELECT filename AS name, uploaded_by AS user, uploaded_at AS date
-        FROM files
-        ORDER BY uploaded_at DESC
-    """)
-    files = c.fetchall()
+@app.route('/admin/api/users')
+@login_required
+def admin_api_users():
+    if current_user.role != 'admin':
+        return jsonify(error='Acceso denegado'), 403
 
-    conn.close()
+    try:
+        rows, next_cursor = pagination.list_users(
+            get_db(),
+            cursor=request.args.get('cursor'),
+            limit=pagination.parse_limit(request.args.get('limit'))
+        )
+    except InvalidCursor:
+        return jsonify(error='Cursor inválido'), 400
+    return jsonify(items=[dict(r) for r in rows], next_cursor=next_cursor)
 
-    return render_template(
-        'admin.html',
-        total_users=total_users,
-        total_files=total_files,
-        total_logs=total_logs,
-        users=users,
-        files=files
+@app.route('/admin/api/stats')
+@login_required
+def admin_api_stats():
+    if current_user.role != 'admin':
+        return jsonify(error='Acceso denegado'), 403
+
+    # Totales y subidas por día ('YYYY-MM-DD'; since inclusivo, until exclusivo)
+    return jsonify(
+        totals=stats.global_stats(get_db()),
+        uploads_per_day=stats.uploads_per_day(
+            get_db(),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+        ),
     )
 
+# ---------- MÉTRICAS (PROMETHEUS) ----------
+@app.route('/metrics')
+@login_required
+def metrics_endpoint():
+    if current_user.role != 'admin':
+        abort(403)
+
+    body = metrics.render({
+        'user_cache': (user_cache.stats(), ('hits', 'misses', 'expirations', 'invalidations')),
+        'audit': (audit.writer.stats(), ('enqueued', 'written', 'dropped', 'failed', 'batches')),
+        'password_pool': (passwords.stats(), ('completed', 'rejected')),
+    })
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+# ---------- CAMBIAR ROL ----------
+@app.route('/admin/users/<int:user_id>/role', methods=['POST'])
+@login_required
+def change_role(user_id):
+    if current_user.role != 'admin':
+        flash('Acceso denegado. No tienes permisos de administrador.', 'danger')
+        return redirect(url_for('dashboard'))
+
+    role = request.form.get('role')
+    if role not in ('user', 'admin'):
+        flash('Rol inválido', 'danger')
+        return redirect(url_for('admin_panel'))
+
+    with transaction() as conn:
+        conn.execute("UPDATE users SET role=? WHERE id=?", (role, user_id))
+    invalidate_user(user_id)
+
+    audit.record('role', f"Rol del usuario {user_id} cambiado a '{role}' por {current_user.username}", current_user.id)
+    flash('Rol actualizado correctamente', 'success')
+    return redirect(url_for('admin_panel'))
+
 # ---------- DESCARGAR ARCHIVO ----------
-@app.route('/download/<filename>')
+@app.route('/download/<int:file_id>')
+@login_required
+def download(file_id):
+    # Por id: varios archivos pueden compartir nombre (incluso del mismo usuario)
+    c = get_db().cursor()
+    if current_user.role == 'admin':
+        c.execute("SELECT physical_path, sha256, filename FROM files WHERE id=?", (file_id,))
+    else:
+        c.execute("SELECT physical_path, sha256, filename FROM files WHERE id=? AND user_id=?",
+                  (file_id, current_user.id))
+    row = c.fetchone()
+
+    if not row:
+        abort(404)
+    filename = row[2]
+    # Archivos anteriores al almacén de blobs siguen en uploads/<filename>
+    path = safe_join(storage.upload_folder(), row[0] or filename)
+    if not path or not os.path.isfile(path):
+        abort(404)
+
+    response = send_stored_file(path, filename, etag=row[1])
+    # Las peticiones de rangos intermedios (reproductores, gestores de descarga)
+    # no generan un evento cada una; solo la respuesta completa o el primer rango
+    if response.status_code == 200 or (response.status_code == 206 and request.range.ranges[0][0] == 0):
+        audit.record('download', f'Archivo descargado: {filename} por {current_user.username}', current_user.id)
+    return response
+
+# ---------- DESCARGAR VARIOS (ZIP) ----------
+@app.route('/download-zip', methods=['GET', 'POST'])
+@login_required
+def download_zip():
+    # ids=<id>&ids=<id>... elige archivos; sin ids se descargan todos los del usuario
+    ids = request.values.getlist('ids', type=int)
+    if len(ids) > archives.MAX_FILES:
+        abort(413)
+
+    c = get_db().cursor()
+    rows = []
+    if ids:
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            sql = f"SELECT id, filename, physical_path, uploaded_at FROM files WHERE id IN ({','.join('?' * len(batch))})"
+            params = list(batch)
+            if current_user.role != 'admin':
+                sql += " AND user_id = ?"
+                params.append(current_user.id)
+            c.execute(sql, params)
+            rows.extend(c.fetchall())
+        rows.sort(key=lambda r: r['id'])
+    else:
+        # Sin tope: el ZIP se arma en streaming y solo se guardan los metadatos
+        c.execute("SELECT id, filename, physical_path, uploaded_at FROM files WHERE user_id = ? ORDER BY id",
+                  (current_user.id,))
+        rows = c.fetchall()
+
+    if not rows:
+        abort(404)
+
+    folder = storage.upload_folder()
+    names = archives.unique_names([r['filename'] for r in rows])
+    entries = []
+    for name, row in zip(names, rows):
+        path = safe_join(folder, row['physical_path'] or row['filename'])
+        if path:
+            entries.append((name, path, row['uploaded_at']))
+
+    response = app.response_class(archives.stream_zip(entries), mimetype='application/zip', direct_passthrough=True)
+    archive_name = f"{secure_filename(current_user.username) or 'archivos'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip"
+    response.headers.set('Content-Disposition', 'attachment', filename=archive_name)
+    response.headers['Cache-Control'] = 'private, no-store'
+    audit.record('download', f'Descarga ZIP de {len(entries)} archivos por {current_user.username}', current_user.id)
+    return response
+
+# ---------- ELIMINAR ARCHIVO ----------
+@app.route('/delete/<int:file_id>', methods=['POST'])
 @login_required
-def download(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+def delete_file(file_id):
+    filename = storage.delete_file(get_db(), file_id, current_user.id)
+
+    if filename is None:
+        flash('Archivo no encontrado', 'danger')
+    else:
+        audit.record('delete', f'Archivo eliminado: {filename} por {current_user.username}', current_user.id)
+        flash('Archivo eliminado correctamente', 'success')
+    return redirect(url_for('dashboard'))
 
 # ---------- LOGOUT ----------
 @app.route('/logout')
 @login_required
 def logout():
-    username = current_user.username
+    username, user_id = current_user.username, current_user.id
     logout_user()
-    logging.info(f'Usuario cerró sesión: {username}')
+    audit.record('logout', f'Usuario cerró sesión: {username}', user_id)
     return redirect(url_for('login'))
 
-# ------------------ CREAR BASE DE DATOS ------------------
-def init_db():
-    conn = sqlite3.connect('database.db')
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT DEFAULT 'user'
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            user_id INTEGER,
-            uploaded_by TEXT,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
-    conn.commit()
+# ------------------ COMANDOS ------------------
+@app.cli.command('stats')
+@click.option('--rebuild', is_flag=True, help='Recalcula los agregados si hay diferencias.')
+def stats_command(rebuild):
+    """Verifica (y opcionalmente repara) los agregados de almacenamiento."""
+    conn = db.connect()
+    drift = stats.verify(conn)
+    for line in drift:
+        click.echo(line)
+    if not drift:
+        click.echo('Agregados correctos')
+    elif rebuild:
+        stats.rebuild(conn)
+        click.echo('Agregados reconstruidos')
+    conn.close()
+
+@app.cli.command('reindex')
+@click.option('--user', 'username', default=None, help='Solo los archivos de este usuario.')
+def reindex_command(username):
+    """Vuelve a extraer el texto de los archivos para el buscador."""
+    conn = db.connect()
+    user_id = None
+    if username:
+        row = conn.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
+        if not row:
+            raise click.ClickException(f'No existe el usuario {username}')
+        user_id = row[0]
+    total = search.reindex(conn, os.path.abspath(app.config['UPLOAD_FOLDER']), user_id)
+    click.echo(f'Archivos indexados: {total}')
     conn.close()
 
 # ------------------ MAIN ------------------
@@ -0,0 +1,111 @@
+import logging
+import os
+import zipfile
+from datetime import datetime
+
+# ------------------ DESCARGA MÚLTIPLE EN ZIP ------------------
+# El ZIP se arma sobre la marcha: zipfile escribe en un sumidero sin seek que
+# solo guarda lo último escrito, y el generador lo vacía después de cada
+# bloque. No se crea ningún archivo temporal y la memoria no depende del
+# tamaño total. Cada entrada lleva su descriptor de datos (CRC y tamaños al
+# final), y ZIP64 se activa solo en las entradas que lo necesitan.
+
+BLOCK_SIZE = 256 * 1024
+MAX_FILES = 10000                # Tope de ids explícitos por petición
+
+# Formatos ya comprimidos: desinflarlos otra vez solo gasta CPU
+STORED_EXTENSIONS = {
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst', '.lz4',
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.avif',
+    '.mp3', '.aac', '.ogg', '.opus', '.flac', '.m4a',
+    '.mp4', '.m4v', '.mkv', '.webm', '.mov', '.avi',
+    '.pdf', '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub', '.jar', '.apk',
+}
+
+
+class _Sink:
+    """Destino de escritura para zipfile; sin tell/seek se activa el modo streaming."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Devuelve (como iterable) lo escrito desde la última llamada."""
+        chunks, self._chunks = self._chunks, []
+        if chunks:
+            yield b''.join(chunks)
+
+
+def compress_type(filename):
+    if os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def unique_names(names):
+    """Nombres seguros para el ZIP; los duplicados quedan como 'nombre (1).ext', ...
+
+    Solo se conserva el último segmento del nombre (sin '.', '..' ni rutas),
+    así ninguna entrada puede escribir fuera de la carpeta al descomprimir.
+    """
+    seen = set()
+    result = []
+    for name in names:
+        segments = [s for s in name.replace('\\', '/').split('/') if s not in ('', '.', '..')]
+        name = segments[-1] if segments else 'archivo'
+        candidate = name
+        base, ext = os.path.splitext(name)
+        n = 1
+        while candidate.lower() in seen:
+            candidate = f'{base} ({n}){ext}'
+            n += 1
+        seen.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def _date_time(uploaded_at):
+    try:
+        value = datetime.strptime(uploaded_at or '', "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        value = datetime.now()
+    # El formato ZIP no admite fechas anteriores a 1980
+    return max(value, datetime(1980, 1, 1)).timetuple()[:6]
+
+
+def stream_zip(entries):
+    """Genera los bytes de un ZIP con `entries` = [(nombre, ruta, fecha)].
+
+    Los archivos que ya no existen en disco se omiten.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zf:
+        for name, path, uploaded_at in entries:
+            try:
+                f = open(path, 'rb')
+            except OSError as e:
+                logging.warning(f'Se omite {name} del ZIP: {e}')
+                continue
+            with f:
+                info = zipfile.ZipInfo(name, date_time=_date_time(uploaded_at))
+                info.compress_type = compress_type(name)
+                # Con el tamaño conocido zipfile decide si la entrada necesita ZIP64
+                info.file_size = os.fstat(f.fileno()).st_size
+                info.external_attr = 0o644 << 16
+                with zf.open(info, 'w') as dest:
+                    while True:
+                        data = f.read(BLOCK_SIZE)
+                        if not data:
+                            break
+                        dest.write(data)
+                        yield from sink.drain()
+            yield from sink.drain()
+    # Directorio central y registro final
+    yield from sink.drain()
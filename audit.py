@@ -0,0 +1,151 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import db
+
+# ------------------ BITÁCORA DE AUDITORÍA ------------------
+# Los handlers encolan eventos en memoria y un hilo escritor los guarda en la
+# tabla `logs` por lotes (un solo INSERT multi-fila por transacción), cuando
+# se juntan BATCH_SIZE eventos o pasan FLUSH_INTERVAL segundos. Si la cola se
+# llena se espera un momento (backpressure) y después el evento se descarta y
+# se cuenta en `dropped`.
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0             # Segundos
+ENQUEUE_TIMEOUT = 0.05           # Espera máxima de un handler con la cola llena
+
+_STOP = object()
+
+
+class AuditWriter:
+    def __init__(self, maxsize=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL,
+                 enqueue_timeout=ENQUEUE_TIMEOUT):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Los handlers y el hilo escritor los actualizan a la vez
+        self._counters = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+        self._counters_lock = threading.Lock()
+
+    # ---------- PRODUCTORES ----------
+
+    def record(self, action, message, user_id=None):
+        """Encola un evento. Devuelve False si se descartó por la cola llena."""
+        self._ensure_started()
+        event = (user_id, action, message, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        try:
+            self._queue.put(event, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def flush(self, timeout=5.0):
+        """Espera a que todo lo encolado hasta ahora quede escrito."""
+        if not self._running():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout=5.0):
+        if not self._running():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {'queued': self._queue.qsize(), **counters}
+
+    def _count(self, key, delta=1):
+        with self._counters_lock:
+            self._counters[key] += delta
+
+    # ---------- HILO ESCRITOR ----------
+
+    def _running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_started(self):
+        # Se arranca al primer evento (y de nuevo tras un fork, p. ej. gunicorn)
+        if self._running():
+            return
+        with self._lock:
+            if self._running():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        conn = db.connect()
+        batch, waiters = [], []
+        stopping = False
+        try:
+            while not stopping:
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 and not waiters:
+                        break
+                    try:
+                        item = self._queue.get(timeout=max(remaining, 0) if not waiters else 0)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        continue
+                    batch.append(item)
+
+                if batch:
+                    self._write(conn, batch)
+                    batch = []
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+        finally:
+            conn.close()
+
+    def _write(self, conn, batch):
+        try:
+            with db.transaction(conn):
+                conn.execute(
+                    "INSERT INTO logs (user_id, action, message, timestamp) VALUES "
+                    + ", ".join(["(?, ?, ?, ?)"] * len(batch)),
+                    [value for event in batch for value in event]
+                )
+            self._count('written', len(batch))
+            self._count('batches')
+        except Exception as e:
+            self._count('failed', len(batch))
+            logging.error(f'No se pudo guardar la bitácora ({len(batch)} eventos): {e}')
+
+
+writer = AuditWriter()
+atexit.register(writer.stop)
+
+
+def record(action, message, user_id=None):
+    """Registra un evento en el log de la aplicación y en la tabla `logs`."""
+    logging.info(message)
+    writer.record(action, message, user_id)
@@ -0,0 +1,124 @@
+"""Rendimiento del login con bcrypt en el hilo de la petición vs. en el pool.
+
+Crea una base temporal con usuarios de prueba, levanta la app en un servidor
+werkzeug con hilos y lanza ráfagas de logins concurrentes mientras un hilo
+sonda pide GET /login (ruta sin bcrypt) y mide su latencia. Se ejecuta dos
+veces: con PASSWORD_POOL_ENABLED en False y en True.
+
+    python benchmarks/bench_login.py --users 20 --clients 32 --duration 10
+"""
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import common  # noqa: E402
+
+
+def timed(call, *args):
+    start = time.perf_counter()
+    status, _ = call(*args)
+    return status, time.perf_counter() - start
+
+
+def run_phase(app, passwords, port, args, enabled):
+    app.config['PASSWORD_POOL_ENABLED'] = enabled
+    passwords.init_app(app)
+    passwords.warm_up()
+
+    stop = threading.Event()
+    results = {'ok': 0, 'busy': 0, 'error': 0}
+    lock = threading.Lock()
+    probe = []
+
+    def client(i):
+        http = common.HttpClient(port)
+        form = {'username': common.user_name(i % args.users), 'password': common.PASSWORD}
+        while not stop.is_set():
+            status, _ = timed(http.post, '/login', form)
+            key = 'ok' if status == 302 else 'busy' if status == 429 else 'error'
+            with lock:
+                results[key] += 1
+
+    def prober():
+        http = common.HttpClient(port)
+        while not stop.is_set():
+            probe.append(timed(http.get, '/login')[1])
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    threads.append(threading.Thread(target=prober))
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'pool': enabled,
+        'logins_per_sec': round(results['ok'] / elapsed, 1),
+        'rejected_429': results['busy'],
+        'errors': results['error'],
+        'probe_p50_ms': round(common.percentile(probe, 50) * 1000, 1),
+        'probe_p99_ms': round(common.percentile(probe, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--rounds', type=int, default=None, help='BCRYPT_LOG_ROUNDS (por defecto el de la app)')
+    parser.add_argument('--keep', action='store_true', help='No borra el directorio temporal al terminar')
+    args = parser.parse_args()
+
+    workdir = common.make_workdir()
+    os.chdir(workdir)
+    try:
+        import logging
+        from werkzeug.serving import make_server
+        import audit
+        import passwords
+        from app import app
+        from init_db import init_db
+
+        logging.disable(logging.INFO)
+        # El formulario del benchmark no lleva token CSRF
+        app.config['WTF_CSRF_ENABLED'] = False
+        if args.rounds:
+            app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+            passwords.init_app(app)
+        init_db()
+        # Solo usuarios: sin archivos de relleno ni descargas
+        common.seed(app, users=args.users, files_per_user=0, total_files=0, download_files=0)
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        print(f'rondas={passwords.LOG_ROUNDS} workers={passwords.WORKERS} '
+              f'max_pendientes={passwords.MAX_PENDING} clientes={args.clients} dir={workdir}')
+        try:
+            for enabled in (False, True):
+                result = run_phase(app, passwords, server.server_port, args, enabled)
+                print('  '.join(f'{k}={v}' for k, v in result.items()))
+        finally:
+            server.shutdown()
+            audit.writer.stop()
+    finally:
+        os.chdir(BENCH_DIR)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""Utilidades compartidas por los benchmarks: datos de prueba, clientes y medidas."""
+import http.client
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = 'bench-pass'
+HEAVY_USER = 'bench_heavy'
+READER_USER = 'bench_reader'
+ADMIN_USER = 'bench_admin'
+
+
+def user_name(i):
+    return f'bench_user{i}'
+
+
+# ------------------ ENTORNO Y DATOS ------------------
+
+def make_workdir():
+    """Directorio temporal con una copia de database.db del repositorio."""
+    workdir = tempfile.mkdtemp(prefix='driveme_bench_')
+    source = os.path.join(ROOT, 'database.db')
+    if os.path.exists(source):
+        shutil.copy(source, os.path.join(workdir, 'database.db'))
+    return workdir
+
+
+def _store_blob(conn, storage, data):
+    spool = storage.HashingFile(storage.upload_folder())
+    spool.write(data)
+    spool.sync()
+    return storage.commit_blob(conn, spool)
+
+
+def seed(app, users=50, files_per_user=10000, total_files=100000, download_files=32,
+         download_size=1024 * 1024, log_rounds=None):
+    """Llena la base del directorio actual; devuelve lo que usan las cargas.
+
+    - `bench_heavy` tiene `files_per_user` archivos (listado del dashboard).
+    - El resto hasta `total_files` se reparte entre `users` usuarios (panel admin).
+    - `bench_reader` tiene `download_files` archivos de `download_size` bytes,
+      cada uno con su propio blob (descargas en frío y en caliente).
+    """
+    import db
+    import passwords
+    import storage
+
+    rng = random.Random(1234)
+    pw_hash = passwords._hash(PASSWORD, log_rounds or passwords.LOG_ROUNDS)
+    now = datetime.now()
+
+    def timestamp():
+        return (now - timedelta(seconds=rng.randrange(365 * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+    with app.app_context():
+        conn = db.connect()
+        with db.transaction(conn):
+            names = [user_name(i) for i in range(users)] + [HEAVY_USER, READER_USER]
+            conn.executemany("INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, 'user')",
+                             [(name, pw_hash) for name in names])
+            conn.execute("INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, 'admin')",
+                         (ADMIN_USER, pw_hash))
+            ids = dict(conn.execute("SELECT username, id FROM users WHERE username LIKE 'bench_%'").fetchall())
+
+            # Blobs pequeños compartidos por las filas de relleno
+            shared = [_store_blob(conn, storage, rng.randbytes(rng.choice((2048, 16384, 131072))))
+                      for _ in range(16)]
+
+            downloads = []
+            for i in range(download_files):
+                sha256, size, relpath = _store_blob(conn, storage, rng.randbytes(download_size))
+                c = conn.execute("""
+                    INSERT INTO files (filename, user_id, uploaded_by, uploaded_at, file_size, physical_path, sha256)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (f'descarga_{i}.bin', ids[READER_USER], READER_USER, timestamp(), size, relpath, sha256))
+                downloads.append((c.lastrowid, os.path.join(storage.upload_folder(), relpath)))
+
+            def rows(owner, count, prefix):
+                for i in range(count):
+                    sha256, size, relpath = rng.choice(shared)
+                    yield (f'{prefix}_{i}.txt', ids[owner], owner, timestamp(), size, relpath, sha256)
+
+            insert = """
+                INSERT INTO files (filename, user_id, uploaded_by, uploaded_at, file_size, physical_path, sha256)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """
+            conn.executemany(insert, rows(HEAVY_USER, files_per_user, 'doc'))
+            remaining = max(total_files - files_per_user, 0)
+            for i in range(users):
+                share = remaining // users + (1 if i < remaining % users else 0)
+                conn.executemany(insert, rows(user_name(i), share, f'u{i}'))
+
+            conn.execute("UPDATE blobs SET refcount = (SELECT COUNT(*) FROM files WHERE files.sha256 = blobs.sha256)")
+        conn.execute("ANALYZE")
+        conn.close()
+
+    return {'downloads': downloads, 'users': users}
+
+
+def drop_page_cache(path):
+    """Saca el archivo de la caché de páginas del SO (descarga en frío)."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+# ------------------ MEMORIA ------------------
+
+def reset_peak_rss(pid):
+    # Linux: escribir 5 en clear_refs reinicia VmHWM
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mib(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid == os.getpid():
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return None
+
+
+# ------------------ CLIENTES ------------------
+
+class TestClient:
+    """Adaptador sobre app.test_client()."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def get(self, path, headers=None):
+        response = self._client.get(path, headers=headers)
+        return response.status_code, len(response.get_data())
+
+    def post(self, path, data=None, files=None):
+        data = dict(data or {})
+        for field, (filename, content) in (files or {}).items():
+            data[field] = (io.BytesIO(content), filename)
+        response = self._client.post(path, data=data,
+                                     content_type='multipart/form-data' if files else None)
+        return response.status_code, len(response.get_data())
+
+    def login(self, username, password=PASSWORD):
+        return self.post('/login', {'username': username, 'password': password})[0]
+
+
+class HttpClient:
+    """Cliente HTTP mínimo con cookies contra el servidor lanzado aparte."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+
+    def _request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            received = 0
+            while True:
+                chunk = response.read(256 * 1024)
+                if not chunk:
+                    break
+                received += len(chunk)
+            for header in response.headers.get_all('Set-Cookie') or ():
+                for name, morsel in SimpleCookie(header).items():
+                    self.cookies[name] = morsel.value
+            return response.status, received
+        finally:
+            conn.close()
+
+    def get(self, path, headers=None):
+        return self._request('GET', path, headers=headers)
+
+    def post(self, path, data=None, files=None):
+        if not files:
+            return self._request('POST', path, urlencode(data or {}),
+                                 {'Content-Type': 'application/x-www-form-urlencoded'})
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in (data or {}).items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for field, (filename, content) in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+            )
+            parts.append(content)
+            parts.append(b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return self._request('POST', path, b''.join(parts),
+                             {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+    def login(self, username, password=PASSWORD):
+        return self.post('/login', {'username': username, 'password': password})[0]
+
+
+# ------------------ EJECUCIÓN Y RESUMEN ------------------
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def run_concurrent(make_client, task, requests, concurrency, ok_status=(200,)):
+    """Ejecuta `requests` llamadas a task(client, i) repartidas en `concurrency` hilos.
+
+    `make_client(n)` crea (y autentica) el cliente del hilo n antes de medir.
+    """
+    clients = [make_client(n) for n in range(concurrency)]
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    latencies, errors, transferred = [], [0], [0]
+    statuses = {}
+
+    def worker(client):
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                status, nbytes = task(client, i)
+            except Exception:
+                status, nbytes = None, 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                transferred[0] += nbytes
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status not in ok_status:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies, elapsed, errors[0], transferred[0], concurrency)
+    result['statuses'] = statuses
+    return result
+
+
+def summarize(latencies, elapsed, errors, transferred, concurrency):
+    return {
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'errors': errors,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'transfer_mib_s': round(transferred / elapsed / 1024 / 1024, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+def random_payload(size):
+    # Contenido distinto en cada subida para que no se deduplique el blob
+    return os.urandom(size)
@@ -0,0 +1,275 @@
+"""Benchmarks de las rutas críticas (subidas, descargas, dashboard, admin, login).
+
+Crea un directorio temporal con una copia de database.db, lo llena con datos
+de prueba (un usuario con 10k+ archivos, una tabla `files` grande, blobs para
+descargar) y ejecuta cada carga dos veces: con el test client de Flask dentro
+de este proceso y contra un servidor werkzeug lanzado en otro proceso.
+
+Por carga se informa throughput, p50/p95/p99, errores y el pico de RSS del
+proceso que atiende las peticiones. El resultado se guarda en JSON y puede
+compararse con un baseline guardado para detectar regresiones.
+
+    python benchmarks/run.py                          # todo, escala completa
+    python benchmarks/run.py --scale 0.2 --mode client
+    python benchmarks/run.py --save-baseline          # guarda benchmarks/baseline.json
+    python benchmarks/run.py --baseline benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import common  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+# nombre -> (peticiones, concurrencia)
+WORKLOADS = {
+    'upload_small': (200, 8),
+    'upload_large': (20, 4),
+    'download_cold': (64, 8),
+    'download_warm': (200, 8),
+    'dashboard': (100, 8),
+    'admin_panel': (30, 4),
+    'login_burst': (40, 8),
+}
+
+
+# ------------------ CARGAS ------------------
+
+def _logged_in(factory, username):
+    def make_client(n):
+        client = factory()
+        name = username(n) if callable(username) else username
+        if client.login(name) != 302:
+            raise RuntimeError(f'No se pudo iniciar sesión como {name}')
+        return client
+    return make_client
+
+
+def run_workload(name, factory, data, args, requests, concurrency):
+    downloads = data['downloads']
+
+    if name in ('upload_small', 'upload_large'):
+        size = args.small_size if name == 'upload_small' else args.large_size
+        payloads = [common.random_payload(size) for _ in range(min(requests, 64))]
+
+        def task(client, i):
+            # Contenido distinto en cada subida para que no se deduplique
+            content = payloads[i % len(payloads)][:-8] + i.to_bytes(8, 'big')
+            return client.post('/dashboard', files={'file': (f'subida_{i}.dat', content)})
+        return common.run_concurrent(_logged_in(factory, lambda n: common.user_name(n % data['users'])),
+                                     task, requests, concurrency, ok_status=(302,))
+
+    if name == 'download_cold':
+        def task(client, i):
+            file_id, path = downloads[i % len(downloads)]
+            common.drop_page_cache(path)
+            return client.get(f'/download/{file_id}')
+        return common.run_concurrent(_logged_in(factory, common.READER_USER), task, requests, concurrency)
+
+    if name == 'download_warm':
+        hot = downloads[:4]
+        for _, path in hot:
+            with open(path, 'rb') as f:
+                while f.read(1024 * 1024):
+                    pass
+
+        def task(client, i):
+            return client.get(f'/download/{hot[i % len(hot)][0]}')
+        return common.run_concurrent(_logged_in(factory, common.READER_USER), task, requests, concurrency)
+
+    if name == 'dashboard':
+        return common.run_concurrent(_logged_in(factory, common.HEAVY_USER),
+                                     lambda client, i: client.get('/dashboard'), requests, concurrency)
+
+    if name == 'admin_panel':
+        return common.run_concurrent(_logged_in(factory, common.ADMIN_USER),
+                                     lambda client, i: client.get('/admin'), requests, concurrency)
+
+    if name == 'login_burst':
+        def task(client, i):
+            return client.post('/login', {'username': common.user_name(i % data['users']),
+                                          'password': common.PASSWORD})
+        # 429 es el rechazo esperado cuando el pool de bcrypt está lleno
+        return common.run_concurrent(lambda n: factory(), task, requests, concurrency, ok_status=(302, 429))
+
+    raise ValueError(name)
+
+
+def run_mode(mode, factory, pid, data, args):
+    results = {}
+    for name in args.workloads:
+        requests, concurrency = WORKLOADS[name]
+        requests = max(int(requests * args.scale), concurrency)
+        common.reset_peak_rss(pid)
+        result = run_workload(name, factory, data, args, requests, concurrency)
+        result['peak_rss_mib'] = common.peak_rss_mib(pid)
+        results[f'{mode}/{name}'] = result
+        print(f"{mode:>6}/{name:<14} {result['throughput_rps']:>9.1f} req/s  "
+              f"p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  p99 {result['p99_ms']:>8.1f} ms  "
+              f"err {result['errors']:>3}  rss {result['peak_rss_mib']} MiB", flush=True)
+    return results
+
+
+def start_server(workdir, rounds):
+    cmd = [sys.executable, os.path.join(BENCH_DIR, 'server.py'), '--workdir', workdir]
+    if rounds:
+        cmd += ['--rounds', str(rounds)]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise RuntimeError('El servidor de benchmark no arrancó')
+    return process, int(line)
+
+
+# ------------------ BASELINE ------------------
+
+def compare(results, baseline, threshold):
+    """Devuelve las regresiones: throughput menor o p95 mayor que el umbral relativo."""
+    regressions = []
+    for key, current in sorted(results.items()):
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        if base['throughput_rps'] and current['throughput_rps'] < base['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{key}: throughput {base['throughput_rps']} -> {current['throughput_rps']} req/s")
+        if base['p95_ms'] and current['p95_ms'] > base['p95_ms'] * (1 + threshold):
+            regressions.append(f"{key}: p95 {base['p95_ms']} -> {current['p95_ms']} ms")
+        if current['errors'] > base.get('errors', 0):
+            regressions.append(f"{key}: errores {base.get('errors', 0)} -> {current['errors']}")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(BENCH_DIR),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ------------------ MAIN ------------------
+
+def run_benchmarks(args, workdir):
+    """Prepara la base en `workdir` y ejecuta las cargas; devuelve los resultados."""
+    os.chdir(workdir)
+
+    import logging
+    import audit
+    import passwords
+    from app import app
+    from init_db import init_db
+
+    logging.disable(logging.INFO)
+    app.config['WTF_CSRF_ENABLED'] = False
+    if args.rounds:
+        app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+        passwords.init_app(app)
+    init_db()
+
+    try:
+        start = time.perf_counter()
+        data = common.seed(app, users=args.users, files_per_user=args.files_per_user, total_files=args.total_files,
+                           download_files=args.download_files, download_size=args.download_size)
+        print(f'Datos de prueba en {workdir} ({time.perf_counter() - start:.1f} s)', flush=True)
+
+        results = {}
+        if args.mode in ('client', 'both'):
+            passwords.warm_up()
+            results.update(run_mode('client', lambda: common.TestClient(app), os.getpid(), data, args))
+
+        if args.mode in ('server', 'both'):
+            process, port = start_server(workdir, args.rounds)
+            try:
+                results.update(run_mode('server', lambda: common.HttpClient(port), process.pid, data, args))
+            finally:
+                process.terminate()
+                process.wait(10)
+        return results
+    finally:
+        audit.writer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--mode', choices=('client', 'server', 'both'), default='both')
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplica el número de peticiones')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--files-per-user', type=int, default=10000)
+    parser.add_argument('--total-files', type=int, default=100000)
+    parser.add_argument('--small-size', type=int, default=16 * 1024)
+    parser.add_argument('--large-size', type=int, default=8 * 1024 * 1024)
+    parser.add_argument('--download-files', type=int, default=32)
+    parser.add_argument('--download-size', type=int, default=1024 * 1024)
+    parser.add_argument('--rounds', type=int, default=None, help='BCRYPT_LOG_ROUNDS (por defecto el de la app)')
+    parser.add_argument('--output', default=None, help='JSON de resultados (por defecto benchmarks/results/)')
+    parser.add_argument('--baseline', default=None, help='JSON con el que comparar')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Tolerancia relativa antes de fallar')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Guarda también en {DEFAULT_BASELINE}')
+    parser.add_argument('--keep', action='store_true', help='No borra el directorio temporal al terminar')
+    args = parser.parse_args()
+    # Las rutas se resuelven antes de cambiar al directorio temporal
+    for name in ('output', 'baseline'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    workdir = common.make_workdir()
+    try:
+        results = run_benchmarks(args, workdir)
+    finally:
+        # También si una carga falla: no quedan temporales en /tmp
+        os.chdir(BENCH_DIR)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline', 'save_baseline', 'keep')},
+        },
+        'results': results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Resultados en {output}')
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline actualizado en {DEFAULT_BASELINE}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f'Regresiones (umbral {args.threshold:.0%}):')
+            for line in regressions:
+                print(f'  {line}')
+            sys.exit(1)
+        print('Sin regresiones respecto al baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Servidor werkzeug con hilos sobre un directorio de benchmark.
+
+Lo lanza run.py en un proceso aparte; imprime el puerto en la primera línea.
+
+    python benchmarks/server.py --workdir /tmp/driveme_bench_xxx
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=None, help='BCRYPT_LOG_ROUNDS')
+    args = parser.parse_args()
+
+    os.chdir(args.workdir)
+    from werkzeug.serving import make_server
+    import passwords
+    from app import app
+
+    logging.disable(logging.INFO)
+    # Los formularios del benchmark no llevan token CSRF
+    app.config['WTF_CSRF_ENABLED'] = False
+    if args.rounds:
+        app.config['BCRYPT_LOG_ROUNDS'] = args.rounds
+        passwords.init_app(app)
+    passwords.warm_up()
+
+    # Con SIGTERM se sale limpiamente para que terminen también los procesos del pool
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
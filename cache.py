@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+
+# ------------------ CACHÉ EN MEMORIA ------------------
+
+USER_CACHE_SIZE = 4096
+USER_CACHE_TTL = 30              # Segundos; tope para ver cambios hechos fuera de la app
+
+
+class TTLCache:
+    """Caché LRU acotado cuyas entradas expiran a los `ttl` segundos.
+
+    Es seguro entre hilos y lleva contadores de aciertos, fallos,
+    expiraciones e invalidaciones.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+# Filas de `users` por id, usadas por el user_loader de Flask-Login
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def invalidate_user(user_id):
+    """Debe llamarse después de cualquier escritura sobre la fila del usuario."""
+    user_cache.invalidate(str(user_id))
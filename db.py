@@ -0,0 +1,169 @@
+import logging
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+
+import metrics
+
+# ------------------ ACCESO A DATOS ------------------
+# Conexiones SQLite compartidas por app.py, admin.py y los módulos auxiliares.
+#
+# - Cada conexión se abre una sola vez con WAL, synchronous=NORMAL, mmap y un
+#   caché de páginas grande, y conserva su caché de sentencias preparadas.
+# - Dentro de una petición la conexión se toma del pool al primer uso y se
+#   devuelve en el teardown; fuera de Flask (scripts, hilos de fondo) cada
+#   hilo conserva la suya.
+# - Las escrituras van en transacciones cortas BEGIN IMMEDIATE que se
+#   reintentan con espera exponencial si la base está bloqueada.
+# - Las conexiones y cursores miden cada execute() y lo informan a metrics.
+
+DATABASE = 'database.db'
+
+BUSY_TIMEOUT = 5.0               # Segundos que SQLite espera un bloqueo
+CACHED_STATEMENTS = 256
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 16 * 1024
+POOL_SIZE = 16                   # Conexiones ociosas que se conservan
+WRITE_RETRIES = 5
+
+_pool = queue.LifoQueue()
+_local = threading.local()
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(sql, parameters)
+            failed = False
+            return result
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start, failed)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(sql, seq_of_parameters)
+            failed = False
+            return result
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - start, failed)
+
+
+class TimedConnection(sqlite3.Connection):
+    # Connection.execute de sqlite3 no pasa por Cursor.execute, por eso se
+    # redefinen aquí también
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path=None):
+    """Abre una conexión nueva ya configurada (autocommit, filas tipo Row)."""
+    conn = sqlite3.connect(
+        path or DATABASE,
+        timeout=BUSY_TIMEOUT,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
+        factory=TimedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _acquire():
+    while True:
+        try:
+            conn, path = _pool.get_nowait()
+        except queue.Empty:
+            return connect()
+        if path == DATABASE:
+            return conn
+        conn.close()
+
+
+def _release(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    if _pool.qsize() < POOL_SIZE:
+        _pool.put((conn, DATABASE))
+    else:
+        conn.close()
+
+
+def get_db():
+    """Conexión del contexto actual (petición Flask o hilo)."""
+    if has_app_context():
+        if 'db' not in g:
+            g.db = _acquire()
+        return g.db
+
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'path', None) != DATABASE:
+        conn = _local.conn = connect()
+        _local.path = DATABASE
+    return conn
+
+
+def release_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        _release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
+
+
+def _is_busy(error):
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+@contextmanager
+def transaction(conn=None):
+    """Transacción de escritura corta con reintentos si la base está ocupada.
+
+    Solo se reintenta la adquisición del bloqueo (BEGIN IMMEDIATE), así que el
+    bloque nunca se ejecuta dos veces.
+    """
+    if conn is None:
+        conn = get_db()
+
+    delay = 0.01
+    for attempt in range(WRITE_RETRIES):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            break
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == WRITE_RETRIES - 1:
+                raise
+            logging.warning(f'Base de datos ocupada, reintento {attempt + 1}/{WRITE_RETRIES}')
+            time.sleep(delay + random.uniform(0, delay))
+            delay *= 2
+
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
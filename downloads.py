@@ -0,0 +1,179 @@
+import mimetypes
+import os
+import secrets
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from flask import request, current_app
+from werkzeug.http import http_date, is_resource_modified
+from werkzeug.wsgi import wrap_file
+
+# ------------------ MOTOR DE DESCARGAS ------------------
+# Responde peticiones condicionales (If-None-Match / If-Modified-Since -> 304),
+# rangos simples y múltiples (206, multipart/byteranges) y entrega el cuerpo
+# con `wsgi.file_wrapper` para que servidores como gunicorn usen os.sendfile
+# y los bytes no pasen por buffers de Python.
+
+BLOCK_SIZE = 256 * 1024
+MAX_RANGES = 16
+
+
+class _BoundedFile:
+    """Vista de solo lectura de [offset, offset + length) de un archivo.
+
+    Expone `fileno()` con el descriptor ya posicionado en `offset`, así el
+    servidor WSGI puede usar sendfile (acotado por Content-Length); si no lo
+    hace, `read()` nunca devuelve bytes fuera del rango.
+    """
+
+    def __init__(self, path, offset, length):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _content_disposition(response, download_name, as_attachment):
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        download_name.encode('ascii')
+        response.headers.set('Content-Disposition', disposition, filename=download_name)
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        response.headers.set(
+            'Content-Disposition', disposition,
+            filename=simple,
+            **{'filename*': "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")}
+        )
+
+
+def _resolve_ranges(ranges, size):
+    """Convierte el header Range en intervalos [inicio, fin) válidos y fusionados."""
+    resolved = []
+    for start, stop in ranges.ranges:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            resolved.append((start, stop))
+
+    resolved.sort()
+    merged = []
+    for start, stop in resolved:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def _if_range_matches(etag, last_modified):
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified <= if_range.date
+    return True
+
+
+def _multipart_body(path, parts, boundary, content_type, size):
+    """Genera el cuerpo multipart/byteranges leyendo cada rango por bloques."""
+    with open(path, 'rb') as f:
+        for start, stop in parts:
+            yield (
+                f'\r\n--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+            ).encode('latin-1')
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+        yield f'\r\n--{boundary}--\r\n'.encode('latin-1')
+
+
+def _multipart_length(parts, boundary, content_type, size):
+    length = len(f'\r\n--{boundary}--\r\n')
+    for start, stop in parts:
+        length += len(
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'
+        )
+        length += stop - start
+    return length
+
+
+def send_stored_file(path, download_name, etag=None, as_attachment=True):
+    """Envía un archivo del almacén con soporte de caché condicional y rangos.
+
+    `etag` debería ser el SHA-256 del contenido; si no se conoce se deriva del
+    mtime y el tamaño del archivo.
+    """
+    st = os.stat(path)
+    size = st.st_size
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+    if etag is None:
+        etag = f'{st.st_mtime_ns:x}-{size:x}'
+    content_type = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    response = current_app.response_class(status=200, mimetype=content_type, direct_passthrough=True)
+    response.set_etag(etag)
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Accept-Ranges'] = 'bytes'
+    # Las descargas requieren sesión: solo caché privada y siempre revalidada
+    response.headers['Cache-Control'] = 'private, no-cache'
+    _content_disposition(response, download_name, as_attachment)
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response.status_code = 304
+        response.headers.pop('Content-Type', None)
+        return response
+
+    parts = None
+    if request.range is not None and request.range.units == 'bytes' and _if_range_matches(etag, last_modified):
+        parts = _resolve_ranges(request.range, size)
+        if not parts:
+            response.status_code = 416
+            response.headers['Content-Range'] = f'bytes */{size}'
+            response.headers.pop('Content-Type', None)
+            response.headers.pop('Content-Disposition', None)
+            return response
+        if len(parts) > MAX_RANGES:
+            parts = None
+
+    if parts and len(parts) > 1:
+        boundary = secrets.token_hex(16)
+        response.status_code = 206
+        response.response = _multipart_body(path, parts, boundary, content_type, size)
+        response.content_type = f'multipart/byteranges; boundary={boundary}'
+        response.content_length = _multipart_length(parts, boundary, content_type, size)
+        return response
+
+    start, stop = parts[0] if parts else (0, size)
+    if parts:
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+    response.content_length = stop - start
+    response.response = wrap_file(request.environ, _BoundedFile(path, start, stop - start), BLOCK_SIZE)
+    return response
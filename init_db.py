@@ -1,14 +1,232 @@
-import sqlite3
 import logging
 
-DATABASE = 'database.db'
+import db
+from db import DATABASE
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
+# ------------------ MIGRACIONES ------------------
+# Cada migración se aplica una sola vez; la versión aplicada se guarda en
+# PRAGMA user_version. Las migraciones deben ser idempotentes porque la base
+# pudo haberse creado con app.py, init_db.py o schema.sql.
+
+def _columns(c, table):
+    c.execute(f"PRAGMA table_info({table})")
+    return {row[1] for row in c.fetchall()}
+
+def _add_column(c, table, column, definition):
+    if column not in _columns(c, table):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migrate_blob_store(c):
+    # Los archivos pasan a ser referencias a blobs direccionados por contenido
+    _add_column(c, 'files', 'uploaded_by', 'TEXT')
+    _add_column(c, 'files', 'file_size', 'INTEGER')
+    _add_column(c, 'files', 'physical_path', 'TEXT')
+    _add_column(c, 'files', 'sha256', 'TEXT')
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            physical_path TEXT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+def _migrate_upload_sessions(c):
+    # Subidas reanudables: una sesión por archivo y una fila por bloque recibido
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            total_size INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            temp_path TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS upload_chunks (
+            upload_id TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            PRIMARY KEY (upload_id, idx)
+        ) WITHOUT ROWID
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions (updated_at)")
+
+def _migrate_file_indexes(c):
+    # Índices para los listados paginados del dashboard y del panel admin
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_user_uploaded ON files (user_id, uploaded_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_files_uploaded ON files (uploaded_at)")
+    c.execute("ANALYZE files")
+
+_FILE_ADDED = """
+    INSERT INTO user_stats (user_id, file_count, total_bytes)
+    SELECT NEW.user_id, 1, COALESCE(NEW.file_size, 0) WHERE NEW.user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET file_count = file_count + 1,
+                                        total_bytes = total_bytes + excluded.total_bytes;
+    UPDATE global_stats SET files = files + 1, total_bytes = total_bytes + COALESCE(NEW.file_size, 0)
+    WHERE id = 1;
+    INSERT INTO daily_uploads (day, uploads, total_bytes)
+    VALUES (substr(COALESCE(NEW.uploaded_at, CURRENT_TIMESTAMP), 1, 10), 1, COALESCE(NEW.file_size, 0))
+    ON CONFLICT (day) DO UPDATE SET uploads = uploads + 1,
+                                    total_bytes = total_bytes + excluded.total_bytes;
+"""
+
+_FILE_REMOVED = """
+    UPDATE user_stats SET file_count = file_count - 1, total_bytes = total_bytes - COALESCE(OLD.file_size, 0)
+    WHERE user_id = OLD.user_id;
+    UPDATE global_stats SET files = files - 1, total_bytes = total_bytes - COALESCE(OLD.file_size, 0)
+    WHERE id = 1;
+    UPDATE daily_uploads SET uploads = uploads - 1, total_bytes = total_bytes - COALESCE(OLD.file_size, 0)
+    WHERE day = substr(COALESCE(OLD.uploaded_at, CURRENT_TIMESTAMP), 1, 10);
+"""
+
+def _migrate_aggregates(c):
+    # Agregados por usuario, globales y por día mantenidos con triggers;
+    # stats.rebuild / stats.verify los recalculan si hay desvíos
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            file_count INTEGER NOT NULL DEFAULT 0,
+            total_bytes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS global_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            users INTEGER NOT NULL DEFAULT 0,
+            files INTEGER NOT NULL DEFAULT 0,
+            total_bytes INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS daily_uploads (
+            day TEXT PRIMARY KEY,
+            uploads INTEGER NOT NULL DEFAULT 0,
+            total_bytes INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_files_insert_stats AFTER INSERT ON files BEGIN {_FILE_ADDED} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_files_delete_stats AFTER DELETE ON files BEGIN {_FILE_REMOVED} END")
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_files_update_stats
+        AFTER UPDATE OF user_id, file_size, uploaded_at ON files
+        BEGIN {_FILE_REMOVED} {_FILE_ADDED} END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_users_insert_stats AFTER INSERT ON users
+        BEGIN UPDATE global_stats SET users = users + 1 WHERE id = 1; END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_users_delete_stats AFTER DELETE ON users
+        BEGIN UPDATE global_stats SET users = users - 1 WHERE id = 1; END
+    """)
+
+    # Carga inicial con los datos existentes
+    c.execute("""
+        INSERT OR REPLACE INTO user_stats (user_id, file_count, total_bytes)
+        SELECT user_id, COUNT(*), COALESCE(SUM(file_size), 0) FROM files
+        WHERE user_id IS NOT NULL GROUP BY user_id
+    """)
+    c.execute("""
+        INSERT OR REPLACE INTO daily_uploads (day, uploads, total_bytes)
+        SELECT substr(COALESCE(uploaded_at, CURRENT_TIMESTAMP), 1, 10) AS day, COUNT(*), COALESCE(SUM(file_size), 0)
+        FROM files GROUP BY day
+    """)
+    c.execute("""
+        INSERT OR REPLACE INTO global_stats (id, users, files, total_bytes)
+        SELECT 1, (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM files),
+               (SELECT COALESCE(SUM(file_size), 0) FROM files)
+    """)
+
+def _migrate_audit_log(c):
+    # La tabla logs existe con dos formas (init_db.py y schema.sql); se
+    # unifican las columnas y se indexa por fecha para las consultas por rango
+    _add_column(c, 'logs', 'user_id', 'INTEGER')
+    _add_column(c, 'logs', 'action', 'TEXT')
+    _add_column(c, 'logs', 'message', 'TEXT')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)")
+
+    _add_column(c, 'global_stats', 'logs', 'INTEGER NOT NULL DEFAULT 0')
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_insert_stats AFTER INSERT ON logs
+        BEGIN UPDATE global_stats SET logs = logs + 1 WHERE id = 1; END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_logs_delete_stats AFTER DELETE ON logs
+        BEGIN UPDATE global_stats SET logs = logs - 1 WHERE id = 1; END
+    """)
+    c.execute("UPDATE global_stats SET logs = (SELECT COUNT(*) FROM logs) WHERE id = 1")
+
+def _migrate_search_index(c):
+    # Índice FTS5 de nombre y contenido; el dueño va como token 'u<id>' para
+    # filtrar dentro del MATCH. El contenido lo llena search.py en segundo plano
+    c.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+            filename, content, owner,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3 4'
+        )
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_files_insert_fts AFTER INSERT ON files
+        BEGIN
+            INSERT INTO files_fts (rowid, filename, content, owner)
+            VALUES (NEW.id, NEW.filename, '', 'u' || NEW.user_id);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete_fts AFTER DELETE ON files
+        BEGIN DELETE FROM files_fts WHERE rowid = OLD.id; END
+    """)
+    c.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_files_update_fts AFTER UPDATE OF filename, user_id ON files
+        BEGIN
+            UPDATE files_fts SET filename = NEW.filename, owner = 'u' || NEW.user_id WHERE rowid = OLD.id;
+        END
+    """)
+    c.execute("DELETE FROM files_fts")
+    c.execute("""
+        INSERT INTO files_fts (rowid, filename, content, owner)
+        SELECT id, filename, '', 'u' || user_id FROM files
+    """)
+
+def _migrate_upload_state(c):
+    # Estado de la sesión reanudable: 'open' -> 'completing' -> 'completed'.
+    # La sesión finalizada guarda el file_id para responder a los reintentos
+    _add_column(c, 'upload_sessions', 'state', "TEXT NOT NULL DEFAULT 'open'")
+    _add_column(c, 'upload_sessions', 'file_id', 'INTEGER')
+
+MIGRATIONS = [
+    _migrate_blob_store,
+    _migrate_upload_sessions,
+    _migrate_file_indexes,
+    _migrate_aggregates,
+    _migrate_audit_log,
+    _migrate_search_index,
+    _migrate_upload_state,
+]
+
+def migrate(conn):
+    c = conn.cursor()
+    c.execute("PRAGMA user_version")
+    version = c.fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with db.transaction(conn):
+            migration(c)
+            c.execute(f"PRAGMA user_version = {number}")
+        logging.info(f"Migración aplicada: {number} ({migration.__name__})")
+
 def init_db():
     try:
-        conn = sqlite3.connect(DATABASE)
+        conn = db.connect(DATABASE)
         c = conn.cursor()
-        
+
         # Tabla de usuarios con rol y fecha de creación
         c.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -19,7 +237,7 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        
+
         # Tabla de archivos con fecha, tamaño y ruta física
         c.execute("""
             CREATE TABLE IF NOT EXISTS files (
@@ -32,7 +250,7 @@ def init_db():
                 FOREIGN KEY (user_id) REFERENCES users (id)
             )
         """)
-        
+
         # Tabla de logs
         c.execute("""
             CREATE TABLE IF NOT EXISTS logs (
@@ -41,8 +259,9 @@ def init_db():
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
-        
+
         conn.commit()
+        migrate(conn)
         conn.close()
         logging.info("Base de datos inicializada correctamente (database.db)")
     except Exception as e:
@@ -50,4 +269,4 @@ def init_db():
 
 if __name__ == '__main__':
     logging.info("Ejecutando script init_db.py...")
-    init_db()
\ No newline at end of file
+    init_db()
@@ -0,0 +1,291 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import g, request
+
+# ------------------ MÉTRICAS ------------------
+# Contadores e histogramas en memoria, expuestos en /metrics con el formato de
+# texto de Prometheus. Los hooks de Flask miden cada petición (latencia por
+# endpoint, códigos de estado, bytes recibidos/enviados y peticiones en
+# curso) y db.py informa cada sentencia SQL con `observe_query`.
+#
+# La latencia de una petición llega hasta que la vista devuelve la respuesta;
+# el envío de un cuerpo en streaming no se incluye. En SQL se mide execute(),
+# que en un SELECT incluye preparar la sentencia y obtener la primera fila.
+# BEGIN solo espera el bloqueo de escritura: va a su propio histograma
+# (sqlite_lock_wait_seconds) y no cuenta como consulta lenta.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_DETAIL = True              # False = solo totales, sin desglose por sentencia
+SLOW_QUERY_MS = 100              # None = no registrar consultas lentas
+MAX_STATEMENTS = 500             # Tope de sentencias distintas con desglose
+
+
+class Histogram:
+    """Histograma de buckets fijos, seguro entre hilos."""
+
+    def __init__(self, buckets, lock=None):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = lock or threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._add(i, value)
+
+    def _add(self, i, value):
+        # Requiere tener tomado self._lock
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, acc = [], 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            acc += n
+            cumulative.append((bound, acc))
+        return cumulative, total, count
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}            # endpoint -> Histogram
+            self.requests = {}           # (endpoint, método, estado) -> n
+            self.request_bytes = {}      # endpoint -> bytes recibidos
+            self.response_bytes = {}     # endpoint -> bytes enviados
+            self.in_flight = 0
+            self.queries = 0
+            self.query_errors = 0
+            self.slow_queries = 0
+            self.query_latency = Histogram(QUERY_BUCKETS, self._lock)
+            self.lock_wait = Histogram(LATENCY_BUCKETS, self._lock)
+            self.statements = {}         # sentencia -> [n, segundos, máximo]
+
+    def _histogram(self, endpoint):
+        hist = self.latency.get(endpoint)
+        if hist is None:
+            with self._lock:
+                hist = self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS))
+        return hist
+
+    def add(self, table, key, value=1):
+        with self._lock:
+            table[key] = table.get(key, 0) + value
+
+
+registry = _Registry()
+
+
+# ---------- PETICIONES ----------
+
+def _endpoint():
+    # Solo endpoints registrados: las rutas 404 no abren series nuevas
+    return request.url_rule.endpoint if request.url_rule is not None else 'unknown'
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    with registry._lock:
+        registry.in_flight += 1
+
+
+def _count_body(endpoint, body):
+    sent = 0
+    try:
+        for chunk in body:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        registry.add(registry.response_bytes, endpoint, sent)
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+def _after_request(response):
+    endpoint = _endpoint()
+    g._metrics_status = response.status_code
+    if response.content_length is not None:
+        registry.add(registry.response_bytes, endpoint, response.content_length)
+    elif response.is_streamed:
+        # Cuerpo sin longitud (p. ej. el ZIP): se cuenta a medida que sale
+        response.response = _count_body(endpoint, response.response)
+    return response
+
+
+def _teardown_request(exception=None):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return
+    endpoint = _endpoint()
+    status = g.pop('_metrics_status', 500 if exception is not None else 200)
+    registry._histogram(endpoint).observe(time.perf_counter() - start)
+    registry.add(registry.requests, (endpoint, request.method, status))
+    if request.content_length:
+        registry.add(registry.request_bytes, endpoint, request.content_length)
+    with registry._lock:
+        registry.in_flight -= 1
+
+
+def init_app(app):
+    """Registra los hooks y lee METRICS_QUERY_DETAIL y SLOW_QUERY_MS."""
+    global QUERY_DETAIL, SLOW_QUERY_MS
+    QUERY_DETAIL = app.config.setdefault('METRICS_QUERY_DETAIL', QUERY_DETAIL)
+    SLOW_QUERY_MS = app.config.setdefault('SLOW_QUERY_MS', SLOW_QUERY_MS)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# ---------- SQL ----------
+
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*')
+_SPACES = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Una sola línea; las listas de parámetros de largo variable se colapsan."""
+    return _IN_LIST.sub('(?...)', _SPACES.sub(' ', sql).strip())[:200]
+
+
+def observe_query(sql, elapsed, failed=False):
+    # Se llama en cada execute(): un solo lock y sin trabajo extra si no hay desglose
+    if sql[:5].upper() == 'BEGIN':
+        histogram, buckets, slow = registry.lock_wait, LATENCY_BUCKETS, False
+    else:
+        histogram, buckets = registry.query_latency, QUERY_BUCKETS
+        slow = SLOW_QUERY_MS is not None and elapsed * 1000 >= SLOW_QUERY_MS
+    bucket = bisect.bisect_left(buckets, elapsed)
+    statement = normalize_sql(sql) if QUERY_DETAIL or slow else None
+
+    with registry._lock:
+        histogram._add(bucket, elapsed)
+        registry.queries += 1
+        if failed:
+            registry.query_errors += 1
+        if slow:
+            registry.slow_queries += 1
+        if QUERY_DETAIL:
+            entry = registry.statements.get(statement)
+            if entry is None:
+                if len(registry.statements) >= MAX_STATEMENTS:
+                    statement = 'other'
+                entry = registry.statements.setdefault(statement, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+
+    if slow:
+        logging.warning(f'Consulta lenta ({elapsed * 1000:.1f} ms): {statement}')
+
+
+# ---------- EXPOSICIÓN ----------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+def _histogram_lines(name, hist, **labels):
+    cumulative, total, count = hist.snapshot()
+    lines = []
+    for bound, n in cumulative:
+        lines.append(f'{name}_bucket{_labels(**labels, le=_format_bound(bound))} {n}')
+    lines.append(f'{name}_sum{_labels(**labels)} {total}')
+    lines.append(f'{name}_count{_labels(**labels)} {count}')
+    return lines
+
+
+def _section(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    lines.extend(samples)
+
+
+def render(extra=None):
+    """Todas las métricas en formato de texto de Prometheus.
+
+    `extra` es {prefijo: (dict de stats(), claves que son contadores)} para
+    exportar los stats de otros módulos (caché, bitácora, pool de
+    contraseñas). Las claves indicadas salen como counter con sufijo
+    `_total`; el resto (tamaños, colas, en curso) como gauge.
+    """
+    with registry._lock:
+        latency = dict(registry.latency)
+        requests = dict(registry.requests)
+        request_bytes = dict(registry.request_bytes)
+        response_bytes = dict(registry.response_bytes)
+        statements = {k: list(v) for k, v in registry.statements.items()}
+        in_flight = registry.in_flight
+        queries, errors, slow = registry.queries, registry.query_errors, registry.slow_queries
+
+    lines = []
+    _section(lines, 'http_request_duration_seconds', 'histogram', 'Latencia de las peticiones por endpoint.',
+             [line for endpoint, hist in sorted(latency.items())
+              for line in _histogram_lines('http_request_duration_seconds', hist, endpoint=endpoint)])
+    _section(lines, 'http_requests_total', 'counter', 'Peticiones por endpoint, método y código.',
+             [f'http_requests_total{_labels(endpoint=e, method=m, status=s)} {n}'
+              for (e, m, s), n in sorted(requests.items())])
+    _section(lines, 'http_request_bytes_total', 'counter', 'Bytes recibidos en el cuerpo de las peticiones.',
+             [f'http_request_bytes_total{_labels(endpoint=e)} {n}' for e, n in sorted(request_bytes.items())])
+    _section(lines, 'http_response_bytes_total', 'counter', 'Bytes enviados en el cuerpo de las respuestas.',
+             [f'http_response_bytes_total{_labels(endpoint=e)} {n}' for e, n in sorted(response_bytes.items())])
+    _section(lines, 'http_requests_in_flight', 'gauge', 'Peticiones en curso.',
+             [f'http_requests_in_flight {in_flight}'])
+
+    _section(lines, 'sqlite_queries_total', 'counter', 'Sentencias SQL ejecutadas.', [f'sqlite_queries_total {queries}'])
+    _section(lines, 'sqlite_query_errors_total', 'counter', 'Sentencias SQL que fallaron.',
+             [f'sqlite_query_errors_total {errors}'])
+    _section(lines, 'sqlite_slow_queries_total', 'counter', f'Sentencias de {SLOW_QUERY_MS} ms o más.',
+             [f'sqlite_slow_queries_total {slow}'])
+    _section(lines, 'sqlite_query_duration_seconds', 'histogram', 'Duración de execute() (sin BEGIN).',
+             _histogram_lines('sqlite_query_duration_seconds', registry.query_latency))
+    _section(lines, 'sqlite_lock_wait_seconds', 'histogram', 'Espera del bloqueo de escritura en BEGIN IMMEDIATE.',
+             _histogram_lines('sqlite_lock_wait_seconds', registry.lock_wait))
+    if statements:
+        _section(lines, 'sqlite_statement_calls_total', 'counter', 'Ejecuciones por sentencia.',
+                 [f'sqlite_statement_calls_total{_labels(statement=s)} {v[0]}' for s, v in sorted(statements.items())])
+        _section(lines, 'sqlite_statement_seconds_total', 'counter', 'Tiempo total por sentencia.',
+                 [f'sqlite_statement_seconds_total{_labels(statement=s)} {v[1]}' for s, v in sorted(statements.items())])
+        _section(lines, 'sqlite_statement_max_seconds', 'gauge', 'Ejecución más lenta por sentencia.',
+                 [f'sqlite_statement_max_seconds{_labels(statement=s)} {v[2]}' for s, v in sorted(statements.items())])
+
+    for prefix, (values, counters) in (extra or {}).items():
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                name, kind = f'{prefix}_{key}_total', 'counter'
+            else:
+                name, kind = f'{prefix}_{key}', 'gauge'
+            _section(lines, name, kind, f'{prefix}.{key}', [f'{name} {value}'])
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,153 @@
+import base64
+import json
+
+# ------------------ PAGINACIÓN POR CURSOR ------------------
+# Los listados se recorren con keyset pagination: el cursor guarda la última
+# (uploaded_at, id) devuelta y la siguiente página continúa desde ahí usando
+# los índices idx_files_user_uploaded / idx_files_uploaded, sin OFFSET.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """Decodifica el cursor y exige un valor por cada tipo de `types`."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(types):
+        raise InvalidCursor(cursor)
+    for value, expected in zip(values, types):
+        # bool es subclase de int y no sirve como id
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise InvalidCursor(cursor)
+    return values
+
+
+def parse_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def list_files(conn, user_id=None, cursor=None, limit=DEFAULT_LIMIT, prefix=None,
+               since=None, until=None, order='desc'):
+    """Una página de archivos ordenada por (uploaded_at, id).
+
+    `since` es inclusivo y `until` exclusivo (fechas 'YYYY-MM-DD' o
+    'YYYY-MM-DD HH:MM:SS'). Devuelve (filas, cursor_siguiente o None).
+    """
+    descending = order != 'asc'
+    cmp = '<' if descending else '>'
+    direction = 'DESC' if descending else 'ASC'
+
+    where, params = [], []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if since:
+        where.append("uploaded_at >= ?")
+        params.append(since)
+    if until:
+        where.append("uploaded_at < ?")
+        params.append(until)
+    if prefix:
+        where.append("filename LIKE ? ESCAPE '\\'")
+        params.append(_escape_like(prefix) + '%')
+    if cursor:
+        last_date, last_id = decode_cursor(cursor, str, int)
+        # Forma equivalente a (uploaded_at, id) < (?, ?) que deja usar el índice
+        where.append(f"uploaded_at {cmp}= ? AND (uploaded_at {cmp} ? OR id {cmp} ?)")
+        params.extend([last_date, last_date, last_id])
+
+    sql = "SELECT id, filename, user_id, uploaded_by, uploaded_at, file_size FROM files"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY uploaded_at {direction}, id {direction} LIMIT ?"
+    params.append(limit + 1)
+
+    c = conn.cursor()
+    c.execute(sql, params)
+    rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['uploaded_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def list_users(conn, cursor=None, limit=DEFAULT_LIMIT):
+    """Una página de usuarios ordenada por id."""
+    after = decode_cursor(cursor, int)[0] if cursor else 0
+    c = conn.cursor()
+    c.execute("SELECT id, username, role FROM users WHERE id > ? ORDER BY id LIMIT ?", (after, limit + 1))
+    rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['id'])
+    return rows, next_cursor
+
+
+def list_logs(conn, cursor=None, limit=DEFAULT_LIMIT, since=None, until=None, action=None):
+    """Eventos de la bitácora, del más reciente al más antiguo (índice idx_logs_timestamp)."""
+    where, params = [], []
+    if since:
+        where.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        where.append("timestamp < ?")
+        params.append(until)
+    if action:
+        where.append("action = ?")
+        params.append(action)
+    if cursor:
+        last_time, last_id = decode_cursor(cursor, str, int)
+        where.append("timestamp <= ? AND (timestamp < ? OR id < ?)")
+        params.extend([last_time, last_time, last_id])
+
+    sql = "SELECT id, user_id, action, message, timestamp FROM logs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    c = conn.cursor()
+    c.execute(sql, params)
+    rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def file_to_dict(row):
+    return {
+        'id': row['id'],
+        'filename': row['filename'],
+        'user_id': row['user_id'],
+        'uploaded_by': row['uploaded_by'],
+        'uploaded_at': row['uploaded_at'],
+        'file_size': row['file_size'],
+    }
@@ -0,0 +1,114 @@
+import logging
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+import pools
+
+# ------------------ HASH DE CONTRASEÑAS ------------------
+# bcrypt consume cientos de ms de CPU por llamada. Se ejecuta en un pool de
+# procesos acotado para usar varios núcleos sin frenar al resto de las rutas;
+# si ya hay MAX_PENDING operaciones en curso se rechaza de inmediato con
+# PoolBusy (la ruta responde 429) en vez de acumular una cola.
+
+LOG_ROUNDS = 12
+WORKERS = os.cpu_count() or 2
+MAX_PENDING = WORKERS * 2
+ENABLED = True                   # False = bcrypt en el hilo de la petición
+MAX_PASSWORD_BYTES = 72          # bcrypt ignora lo que pasa de 72 bytes
+
+_pool = pools.ProcessPool(WORKERS)
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+_counters = {'completed': 0, 'rejected': 0, 'in_flight': 0}
+_counters_lock = threading.Lock()
+
+
+class PoolBusy(Exception):
+    pass
+
+
+def init_app(app):
+    """Lee BCRYPT_LOG_ROUNDS y PASSWORD_POOL_* de la configuración."""
+    global LOG_ROUNDS, WORKERS, MAX_PENDING, ENABLED, _slots
+    LOG_ROUNDS = app.config.setdefault('BCRYPT_LOG_ROUNDS', LOG_ROUNDS)
+    WORKERS = app.config.setdefault('PASSWORD_POOL_WORKERS', WORKERS)
+    MAX_PENDING = app.config.setdefault('PASSWORD_POOL_MAX_PENDING', WORKERS * 2)
+    ENABLED = app.config.setdefault('PASSWORD_POOL_ENABLED', ENABLED)
+    _slots = threading.BoundedSemaphore(MAX_PENDING)
+    _pool.workers = WORKERS
+    _pool.discard()
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), pw_hash.encode('utf-8'))
+    except ValueError:
+        # Hash con formato inválido (p. ej. contraseñas en texto plano antiguas)
+        return False
+
+
+def _count(key, delta=1):
+    with _counters_lock:
+        _counters[key] += delta
+
+
+def _run(fn, *args):
+    if not ENABLED:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        _count('rejected')
+        raise PoolBusy()
+    _count('in_flight')
+    try:
+        result = _pool.get().submit(fn, *args).result()
+    except BrokenProcessPool:
+        # Un proceso del pool murió: se descarta el pool y esta llamada se
+        # resuelve en el hilo actual; la siguiente creará uno nuevo.
+        logging.error('El pool de bcrypt se rompió; se recreará')
+        _pool.discard()
+        result = fn(*args)
+    finally:
+        _count('in_flight', -1)
+        _slots.release()
+    _count('completed')
+    return result
+
+
+def hash_password(password, rounds=None):
+    return _run(_hash, password, rounds or LOG_ROUNDS)
+
+
+def check_password(pw_hash, password):
+    return _run(_check, pw_hash, password)
+
+
+def needs_rehash(pw_hash, rounds=None):
+    """True si el hash usa menos rondas que el factor de trabajo configurado."""
+    try:
+        return int(pw_hash.split('$')[2]) < (rounds or LOG_ROUNDS)
+    except (IndexError, ValueError):
+        return True
+
+
+def warm_up():
+    """Arranca los procesos del pool antes de la primera petición."""
+    if ENABLED:
+        pool = _pool.get()
+        for future in [pool.submit(int) for _ in range(WORKERS)]:
+            future.result()
+
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {'enabled': ENABLED, 'workers': WORKERS, 'max_pending': MAX_PENDING, 'log_rounds': LOG_ROUNDS, **counters}
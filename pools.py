@@ -0,0 +1,34 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# ------------------ POOLS DE PROCESOS ------------------
+# Pools con contexto 'spawn' (no heredan hilos ni conexiones SQLite del
+# padre) que se crean al primer uso y de nuevo tras un fork, p. ej. en los
+# workers de gunicorn. Los usan passwords.py (bcrypt) y search.py
+# (extracción de texto).
+
+
+class ProcessPool:
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Devuelve el ProcessPoolExecutor de este proceso, creándolo si hace falta."""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._pid = os.getpid()
+            return self._executor
+
+    def discard(self):
+        """Cierra el pool actual sin esperar; el próximo get() crea uno nuevo."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
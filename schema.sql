@@ -5,6 +5,17 @@
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS files;
 DROP TABLE IF EXISTS logs;
+DROP TABLE IF EXISTS blobs;
+DROP TABLE IF EXISTS upload_sessions;
+DROP TABLE IF EXISTS upload_chunks;
+DROP TABLE IF EXISTS user_stats;
+DROP TABLE IF EXISTS global_stats;
+DROP TABLE IF EXISTS daily_uploads;
+DROP TABLE IF EXISTS files_fts;
+
+-- Sin versión: init_db.py vuelve a aplicar las migraciones, que crean los
+-- triggers de agregados y del índice de búsqueda
+PRAGMA user_version = 0;
 
 -- =========================================
 -- 👤 Tabla de usuarios
@@ -28,17 +39,95 @@ CREATE TABLE files (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     filename TEXT NOT NULL,
     user_id INTEGER,
+    uploaded_by TEXT,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    file_size INTEGER,
+    physical_path TEXT,            -- Ruta del blob relativa a uploads/
+    sha256 TEXT,                   -- Referencia a blobs.sha256
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
+CREATE INDEX idx_files_user_uploaded ON files (user_id, uploaded_at);
+CREATE INDEX idx_files_uploaded ON files (uploaded_at);
+
+-- =========================================
+-- 🧱 Blobs direccionados por contenido
+-- =========================================
+CREATE TABLE blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    physical_path TEXT NOT NULL,   -- blobs/ab/cd/<sha256>
+    refcount INTEGER NOT NULL DEFAULT 0
+);
+
 -- =========================================
 -- 🧾 Registros de actividad
 -- =========================================
 CREATE TABLE logs (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER,
-    action TEXT,
+    action TEXT,                   -- login, logout, register, upload, download, ...
+    message TEXT,
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
+
+CREATE INDEX idx_logs_timestamp ON logs (timestamp);
+
+-- =========================================
+-- ⏫ Subidas reanudables por bloques
+-- =========================================
+CREATE TABLE upload_sessions (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    total_size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    temp_path TEXT NOT NULL,       -- uploads/.tmp/resumable-<id>
+    created_at REAL NOT NULL,      -- Epoch en segundos
+    updated_at REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'open',  -- open, completing o completed
+    file_id INTEGER,               -- Archivo creado al finalizar
+    FOREIGN KEY (user_id) REFERENCES users(id)
+);
+
+CREATE TABLE upload_chunks (
+    upload_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (upload_id, idx)
+) WITHOUT ROWID;
+
+CREATE INDEX idx_upload_sessions_updated ON upload_sessions (updated_at);
+
+-- =========================================
+-- 📊 Agregados (mantenidos con triggers en init_db.py)
+-- =========================================
+CREATE TABLE user_stats (
+    user_id INTEGER PRIMARY KEY,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE global_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    users INTEGER NOT NULL DEFAULT 0,
+    files INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0,
+    logs INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE daily_uploads (
+    day TEXT PRIMARY KEY,          -- YYYY-MM-DD
+    uploads INTEGER NOT NULL DEFAULT 0,
+    total_bytes INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- =========================================
+-- 🔎 Búsqueda de texto completo (FTS5)
+-- =========================================
+CREATE VIRTUAL TABLE files_fts USING fts5(
+    filename, content, owner,      -- owner = 'u' || files.user_id
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3 4'
+);
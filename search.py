@@ -0,0 +1,133 @@
+import logging
+import os
+import re
+
+import db
+import pools
+
+# ------------------ BÚSQUEDA DE TEXTO COMPLETO ------------------
+# files_fts (FTS5) guarda por archivo: nombre, texto extraído y el dueño como
+# token 'u<id>'. Los triggers de `files` mantienen nombre y dueño al instante;
+# el contenido lo extrae en segundo plano un pool de procesos, así la subida
+# nunca espera a la indexación. Las búsquedas filtran por dueño dentro del
+# propio MATCH, de modo que solo se recorren las listas del usuario.
+
+TEXT_EXTENSIONS = {
+    '.txt', '.text', '.csv', '.tsv', '.json', '.md', '.markdown', '.rst', '.log',
+    '.xml', '.html', '.htm', '.yaml', '.yml', '.ini', '.cfg', '.conf', '.toml',
+    '.py', '.js', '.css', '.sql', '.sh',
+}
+MAX_INDEX_BYTES = 1024 * 1024    # Solo se indexa el primer MiB de cada archivo
+WORKERS = 2
+MAX_RESULTS = 100
+
+_pool = pools.ProcessPool(WORKERS)
+
+
+def is_indexable(filename):
+    return os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS
+
+
+def extract_text(path, max_bytes=MAX_INDEX_BYTES):
+    """Lee el inicio del archivo como texto. Se ejecuta en los procesos del pool."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(max_bytes)
+    except OSError:
+        return ''
+    if b'\x00' in data:
+        return ''
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # Puede ser un carácter cortado al final del bloque o texto latin-1
+        if e.start >= len(data) - 3:
+            return data[:e.start].decode('utf-8', errors='replace')
+        return data.decode('latin-1')
+
+
+def _store_content(file_id, content):
+    # Corre en el hilo de resultados del pool, que conserva su propia conexión
+    with db.transaction(db.get_db()) as conn:
+        conn.execute("UPDATE files_fts SET content = ? WHERE rowid = ?", (content, file_id))
+
+
+def _on_extracted(file_id, future):
+    try:
+        content = future.result()
+        if content:
+            _store_content(file_id, content)
+    except Exception as e:
+        logging.error(f'No se pudo indexar el archivo {file_id}: {e}')
+
+
+def schedule(file_id, filename, path):
+    """Encola la extracción de texto de un archivo recién subido."""
+    if not is_indexable(filename):
+        return
+    future = _pool.get().submit(extract_text, path)
+    future.add_done_callback(lambda f: _on_extracted(file_id, f))
+
+
+def reindex(conn, upload_folder, user_id=None, batch_size=200):
+    """Vuelve a extraer el contenido de todos los archivos (o los de un usuario)."""
+    c = conn.cursor()
+    sql = "SELECT id, filename, physical_path FROM files"
+    params = ()
+    if user_id is not None:
+        sql += " WHERE user_id = ?"
+        params = (user_id,)
+    c.execute(sql, params)
+
+    pool = _pool.get()
+    total = 0
+    while True:
+        batch = c.fetchmany(batch_size)
+        if not batch:
+            break
+        rows = [r for r in batch if is_indexable(r['filename'])]
+        if not rows:
+            continue
+        paths = [os.path.join(upload_folder, r['physical_path'] or r['filename']) for r in rows]
+        contents = list(pool.map(extract_text, paths))
+        with db.transaction(conn):
+            conn.executemany(
+                "UPDATE files_fts SET content = ? WHERE rowid = ?",
+                [(content, r['id']) for r, content in zip(rows, contents)]
+            )
+        total += len(rows)
+    return total
+
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def build_query(text, user_id):
+    """Convierte el texto del usuario en una consulta FTS5 segura con prefijos.
+
+    Los términos se limitan a nombre y contenido: sin el filtro de columna
+    'u1' también coincidiría con el token de dueño 'u11'.
+    """
+    terms = _TOKEN.findall(text)
+    if not terms:
+        return None
+    match = ' AND '.join(f'"{term}"*' for term in terms)
+    return f'owner : "u{user_id}" AND {{filename content}} : ({match})'
+
+
+def search(conn, user_id, text, limit=MAX_RESULTS):
+    """Archivos del usuario que coinciden, ordenados por relevancia (bm25)."""
+    query = build_query(text, user_id)
+    if query is None:
+        return []
+    c = conn.cursor()
+    c.execute("""
+        SELECT f.id, f.filename, f.user_id, f.uploaded_by, f.uploaded_at, f.file_size,
+               snippet(files_fts, 1, '', '', '…', 12) AS snippet
+        FROM files_fts
+        JOIN files f ON f.id = files_fts.rowid
+        WHERE files_fts MATCH ?
+        ORDER BY bm25(files_fts, 10.0, 1.0, 0.0)
+        LIMIT ?
+    """, (query, limit))
+    return c.fetchall()
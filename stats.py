@@ -0,0 +1,127 @@
+import logging
+
+from db import transaction
+
+# ------------------ AGREGADOS ------------------
+# user_stats, global_stats y daily_uploads se mantienen con triggers sobre
+# `users`, `files` y `logs` (ver init_db._migrate_aggregates), así que leerlos cuesta
+# O(1). `rebuild` los recalcula desde cero y `verify` detecta desvíos.
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+def global_stats(conn):
+    c = conn.cursor()
+    c.execute("SELECT users, files, total_bytes, logs FROM global_stats WHERE id = 1")
+    row = c.fetchone()
+    if row is None:
+        return {'users': 0, 'files': 0, 'total_bytes': 0, 'logs': 0}
+    return dict(row)
+
+
+def user_stats(conn, user_id):
+    c = conn.cursor()
+    c.execute("SELECT file_count, total_bytes FROM user_stats WHERE user_id = ?", (user_id,))
+    row = c.fetchone()
+    if row is None:
+        return {'file_count': 0, 'total_bytes': 0}
+    return dict(row)
+
+
+def uploads_per_day(conn, since=None, until=None):
+    c = conn.cursor()
+    c.execute("""
+        SELECT day, uploads, total_bytes FROM daily_uploads
+        WHERE day >= COALESCE(?, '') AND day < COALESCE(?, '9999')
+        ORDER BY day
+    """, (since, until))
+    return [dict(row) for row in c.fetchall()]
+
+
+def check_quota(conn, user_id, incoming_bytes, quota):
+    """Lanza QuotaExceeded si el usuario pasaría de `quota` bytes (None = sin límite)."""
+    if not quota:
+        return
+    used = user_stats(conn, user_id)['total_bytes']
+    if used + incoming_bytes > quota:
+        raise QuotaExceeded(f'Cuota excedida: {used + incoming_bytes} de {quota} bytes')
+
+
+# ---------- RECONSTRUCCIÓN / VERIFICACIÓN ----------
+
+_EXPECTED_USER_STATS = """
+    SELECT user_id, COUNT(*) AS file_count, COALESCE(SUM(file_size), 0) AS total_bytes
+    FROM files WHERE user_id IS NOT NULL GROUP BY user_id
+"""
+
+_EXPECTED_DAILY = """
+    SELECT substr(COALESCE(uploaded_at, CURRENT_TIMESTAMP), 1, 10) AS day,
+           COUNT(*) AS uploads, COALESCE(SUM(file_size), 0) AS total_bytes
+    FROM files GROUP BY day
+"""
+
+_EXPECTED_GLOBAL = """
+    SELECT (SELECT COUNT(*) FROM users) AS users,
+           (SELECT COUNT(*) FROM files) AS files,
+           (SELECT COALESCE(SUM(file_size), 0) FROM files) AS total_bytes,
+           (SELECT COUNT(*) FROM logs) AS logs
+"""
+
+
+def populate(c):
+    """Recalcula todos los agregados; debe ejecutarse dentro de una transacción."""
+    c.execute("DELETE FROM user_stats")
+    c.execute(f"INSERT INTO user_stats (user_id, file_count, total_bytes) {_EXPECTED_USER_STATS}")
+    c.execute("DELETE FROM daily_uploads")
+    c.execute(f"INSERT INTO daily_uploads (day, uploads, total_bytes) {_EXPECTED_DAILY}")
+    c.execute("DELETE FROM global_stats")
+    c.execute(f"INSERT INTO global_stats (id, users, files, total_bytes, logs) SELECT 1, * FROM ({_EXPECTED_GLOBAL})")
+
+
+def rebuild(conn):
+    """Recalcula todos los agregados con un escaneo completo."""
+    with transaction(conn):
+        populate(conn.cursor())
+    logging.info("Agregados reconstruidos")
+
+
+def verify(conn):
+    """Compara los agregados con los valores reales. Devuelve la lista de diferencias."""
+    c = conn.cursor()
+    drift = []
+
+    c.execute(f"""
+        SELECT e.user_id, e.file_count, e.total_bytes, s.file_count, s.total_bytes
+        FROM ({_EXPECTED_USER_STATS}) e LEFT JOIN user_stats s ON s.user_id = e.user_id
+        WHERE s.user_id IS NULL OR s.file_count != e.file_count OR s.total_bytes != e.total_bytes
+        UNION ALL
+        SELECT s.user_id, 0, 0, s.file_count, s.total_bytes
+        FROM user_stats s
+        WHERE (s.file_count != 0 OR s.total_bytes != 0)
+          AND NOT EXISTS (SELECT 1 FROM files f WHERE f.user_id = s.user_id)
+    """)
+    for user_id, count, size, stored_count, stored_size in c.fetchall():
+        drift.append(f'user_stats[{user_id}]: esperado ({count}, {size}), guardado ({stored_count}, {stored_size})')
+
+    c.execute(f"""
+        SELECT e.day, e.uploads, e.total_bytes, d.uploads, d.total_bytes
+        FROM ({_EXPECTED_DAILY}) e LEFT JOIN daily_uploads d ON d.day = e.day
+        WHERE d.day IS NULL OR d.uploads != e.uploads OR d.total_bytes != e.total_bytes
+        UNION ALL
+        SELECT d.day, 0, 0, d.uploads, d.total_bytes
+        FROM daily_uploads d
+        WHERE (d.uploads != 0 OR d.total_bytes != 0)
+          AND d.day NOT IN (SELECT day FROM ({_EXPECTED_DAILY}))
+    """)
+    for day, count, size, stored_count, stored_size in c.fetchall():
+        drift.append(f'daily_uploads[{day}]: esperado ({count}, {size}), guardado ({stored_count}, {stored_size})')
+
+    c.execute(_EXPECTED_GLOBAL)
+    expected = dict(c.fetchone())
+    stored = global_stats(conn)
+    if expected != stored:
+        drift.append(f'global_stats: esperado {expected}, guardado {stored}')
+
+    return drift
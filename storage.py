@@ -0,0 +1,205 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.utils import safe_join
+
+from db import transaction
+import stats
+
+# ------------------ ALMACÉN DE BLOBS ------------------
+# Cada archivo subido se guarda una sola vez, direccionado por su SHA-256:
+#   uploads/blobs/ab/cd/abcd...  (dos niveles de directorios para repartir)
+# La tabla `files` solo referencia el blob; `blobs.refcount` cuenta cuántas
+# filas lo usan y el blob se borra del disco cuando llega a cero.
+
+CHUNK_SIZE = 64 * 1024
+BLOB_DIR = 'blobs'
+TMP_DIR = '.tmp'
+
+
+def upload_folder():
+    return os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+
+
+def blob_relpath(sha256):
+    return os.path.join(BLOB_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def blob_path(sha256):
+    return os.path.join(upload_folder(), blob_relpath(sha256))
+
+
+class HashingFile:
+    """Archivo temporal que calcula el SHA-256 y el tamaño mientras se escribe.
+
+    Se usa como destino del parser multipart de Werkzeug, de modo que el cuerpo
+    de la petición se escribe por bloques directamente al disco sin copias
+    intermedias. Si no se confirma con `commit_blob`, se borra al cerrarse.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.name = tempfile.mkstemp(dir=directory, prefix='upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    @classmethod
+    def from_path(cls, path):
+        """Envuelve un archivo ya escrito en disco y calcula su hash leyéndolo por bloques."""
+        self = cls.__new__(cls)
+        self.name = path
+        self._file = open(path, 'r+b')
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+        while True:
+            chunk = self._file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            self._hash.update(chunk)
+            self.size += len(chunk)
+        return self
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def sync(self):
+        """Vuelca el temporal a disco (flush + fsync)."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+        if not self.committed:
+            try:
+                os.unlink(self.name)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class BlobRequest(Request):
+    """Request que envía los archivos subidos directo a un HashingFile."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(os.path.join(upload_folder(), TMP_DIR))
+
+
+def spool_stream(stream):
+    """Copia por bloques un stream arbitrario a un HashingFile."""
+    spool = HashingFile(os.path.join(upload_folder(), TMP_DIR))
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    return spool
+
+
+def commit_blob(conn, spool):
+    """Mueve el temporal al almacén (o lo descarta si el blob ya existe).
+
+    Debe llamarse dentro de `db.transaction` (BEGIN IMMEDIATE) para que el
+    movimiento en disco y el refcount queden serializados con los borrados.
+    El temporal ya debe estar en disco (`spool.sync()`): un fsync aquí
+    retendría el bloqueo de escritura mientras se escribe todo el archivo.
+    Devuelve (sha256, tamaño, ruta relativa a UPLOAD_FOLDER).
+    """
+    sha256 = spool.hexdigest()
+    relpath = blob_relpath(sha256)
+    c = conn.cursor()
+    c.execute("SELECT physical_path FROM blobs WHERE sha256=?", (sha256,))
+    row = c.fetchone()
+
+    if row:
+        c.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256=?", (sha256,))
+        spool.close()
+        return sha256, spool.size, row[0]
+
+    target = blob_path(sha256)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(spool.name, target)
+    spool.committed = True
+    spool.close()
+    c.execute(
+        "INSERT INTO blobs (sha256, size, physical_path, refcount) VALUES (?, ?, ?, 1)",
+        (sha256, spool.size, relpath)
+    )
+    return sha256, spool.size, relpath
+
+
+def release_blob(conn, sha256):
+    """Resta una referencia al blob y lo borra del disco si ya no se usa."""
+    c = conn.cursor()
+    c.execute("UPDATE blobs SET refcount = refcount - 1 WHERE sha256=?", (sha256,))
+    c.execute("SELECT physical_path, refcount FROM blobs WHERE sha256=?", (sha256,))
+    row = c.fetchone()
+    if row and row[1] <= 0:
+        c.execute("DELETE FROM blobs WHERE sha256=?", (sha256,))
+        try:
+            os.unlink(os.path.join(upload_folder(), row[0]))
+        except FileNotFoundError:
+            logging.warning(f'Blob ya no existía en disco: {sha256}')
+
+
+def add_file(conn, user_id, username, filename, spool, uploaded_at, quota=None):
+    """Registra un archivo del usuario a partir de un HashingFile ya escrito.
+
+    Si se indica `quota` (bytes) y el usuario la excedería, lanza
+    stats.QuotaExceeded y descarta el temporal.
+    """
+    try:
+        # El fsync de un archivo de varios GB va fuera de BEGIN IMMEDIATE
+        spool.sync()
+        with transaction(conn):
+            stats.check_quota(conn, user_id, spool.size, quota)
+            sha256, size, relpath = commit_blob(conn, spool)
+            c = conn.execute("""
+                INSERT INTO files (filename, user_id, uploaded_by, uploaded_at, file_size, physical_path, sha256)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (filename, user_id, username, uploaded_at, size, relpath, sha256))
+    except Exception:
+        spool.close()
+        raise
+    return c.lastrowid
+
+
+def delete_file(conn, file_id, user_id):
+    """Borra la fila del archivo y libera su blob. Devuelve el nombre o None."""
+    with transaction(conn):
+        c = conn.cursor()
+        c.execute("SELECT filename, sha256 FROM files WHERE id=? AND user_id=?", (file_id, user_id))
+        row = c.fetchone()
+        if not row:
+            return None
+        filename, sha256 = row
+        c.execute("DELETE FROM files WHERE id=?", (file_id,))
+
+        if sha256:
+            release_blob(conn, sha256)
+        else:
+            # Archivos anteriores al almacén de blobs: viven en uploads/<filename>
+            c.execute("SELECT 1 FROM files WHERE sha256 IS NULL AND filename=? LIMIT 1", (filename,))
+            legacy_path = safe_join(upload_folder(), filename)
+            if legacy_path and not c.fetchone():
+                try:
+                    os.unlink(legacy_path)
+                except (FileNotFoundError, IsADirectoryError):
+                    pass
+    return filename
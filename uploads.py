@@ -0,0 +1,287 @@
+from flask import Blueprint, request, jsonify, abort, current_app
+from flask_login import login_required, current_user
+from datetime import datetime
+import os, secrets, time, logging
+import storage
+import stats
+import audit
+import search
+from db import get_db, transaction
+
+# ------------------ SUBIDAS REANUDABLES ------------------
+# Flujo del cliente:
+#   POST   /api/uploads                        {filename, size[, chunk_size]}
+#   PUT    /api/uploads/<id>/chunks/<n>        cuerpo = bytes del bloque n
+#   GET    /api/uploads/<id>                   bloques ya recibidos
+#   POST   /api/uploads/<id>/complete          crea la fila en `files`
+#   DELETE /api/uploads/<id>                   cancela la subida
+# Los bloques se escriben en su posición (os.pwrite) sobre un archivo
+# temporal, así que pueden llegar en cualquier orden y varios a la vez.
+#
+# Finalizar es idempotente: la sesión pasa de 'open' a 'completing' en una
+# transacción corta antes de hashear, y al terminar queda en 'completed' con
+# su file_id hasta que se purga. Un reintento recibe el mismo file_id y una
+# llamada concurrente recibe 409 en vez de crear otra fila en `files`.
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_RESUMABLE_SIZE = 50 * 1024 ** 3   # Por defecto; se puede cambiar con app.config
+SESSION_TTL = 24 * 60 * 60       # Segundos sin actividad antes de purgar
+PURGE_INTERVAL = 10 * 60
+
+_last_purge = 0.0
+
+
+def _total_chunks(total_size, chunk_size):
+    return (total_size + chunk_size - 1) // chunk_size
+
+
+def _chunk_length(session, index):
+    offset = index * session['chunk_size']
+    return min(session['chunk_size'], session['total_size'] - offset)
+
+
+def _get_session(conn, upload_id):
+    c = conn.cursor()
+    c.execute("SELECT * FROM upload_sessions WHERE id=? AND user_id=?", (upload_id, current_user.id))
+    session = c.fetchone()
+    if not session:
+        abort(404)
+    return session
+
+
+def _require_open(session):
+    if session['state'] != 'open':
+        abort(409)
+
+
+def _completed(session):
+    return jsonify(file_id=session['file_id'], filename=session['filename'], size=session['total_size']), 200
+
+
+def _remove_session(conn, session):
+    with transaction(conn):
+        conn.execute("DELETE FROM upload_chunks WHERE upload_id=?", (session['id'],))
+        conn.execute("DELETE FROM upload_sessions WHERE id=?", (session['id'],))
+    try:
+        os.unlink(session['temp_path'])
+    except FileNotFoundError:
+        pass
+
+
+def purge_stale_sessions(conn, max_age=None):
+    """Borra las sesiones sin actividad reciente junto con sus temporales."""
+    if max_age is None:
+        max_age = current_app.config.get('RESUMABLE_UPLOAD_TTL', SESSION_TTL)
+    c = conn.cursor()
+    c.execute("SELECT * FROM upload_sessions WHERE updated_at < ?", (time.time() - max_age,))
+    stale = c.fetchall()
+    for session in stale:
+        _remove_session(conn, session)
+    if stale:
+        logging.info(f'Subidas reanudables purgadas: {len(stale)}')
+    return len(stale)
+
+
+def _maybe_purge(conn):
+    global _last_purge
+    now = time.time()
+    if now - _last_purge >= PURGE_INTERVAL:
+        _last_purge = now
+        purge_stale_sessions(conn)
+
+
+# ---------- INICIAR ----------
+@uploads_bp.route('', methods=['POST'])
+@login_required
+def initiate():
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename')
+    total_size = data.get('size')
+    chunk_size = data.get('chunk_size', DEFAULT_CHUNK_SIZE)
+
+    # bool es subclase de int: size=true no es un tamaño
+    if not filename or not isinstance(total_size, int) or isinstance(total_size, bool) or total_size < 0:
+        return jsonify(error='Se requieren filename y size'), 400
+    if not isinstance(chunk_size, int) or isinstance(chunk_size, bool):
+        return jsonify(error='chunk_size inválido'), 400
+    max_size = current_app.config.get('MAX_RESUMABLE_SIZE', MAX_RESUMABLE_SIZE)
+    if total_size > max_size:
+        return jsonify(error=f'El archivo supera el máximo de {max_size} bytes'), 413
+    chunk_size = max(MIN_CHUNK_SIZE, min(chunk_size, MAX_CHUNK_SIZE))
+
+    # Rechazo temprano por cuota; se vuelve a validar al finalizar
+    quota = current_app.config.get('USER_QUOTA_BYTES')
+    try:
+        stats.check_quota(get_db(), current_user.id, total_size, quota)
+    except stats.QuotaExceeded as e:
+        return jsonify(error=str(e)), 413
+
+    upload_id = secrets.token_urlsafe(16)
+    tmp_dir = os.path.join(storage.upload_folder(), storage.TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    temp_path = os.path.join(tmp_dir, f'resumable-{upload_id}')
+    conn = get_db()
+    _maybe_purge(conn)
+
+    # Si algo falla antes de registrar la sesión, el temporal no quedaría
+    # asociado a nada y purge_stale_sessions nunca lo borraría
+    try:
+        # Archivo disperso del tamaño final: cada bloque se escribe en su lugar
+        with open(temp_path, 'wb') as f:
+            f.truncate(total_size)
+        now = time.time()
+        with transaction(conn):
+            conn.execute("""
+                INSERT INTO upload_sessions (id, user_id, filename, total_size, chunk_size, temp_path, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (upload_id, current_user.id, filename, total_size, chunk_size, temp_path, now, now))
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    logging.info(f'Subida reanudable iniciada: {filename} ({total_size} bytes) por {current_user.username}')
+    return jsonify(
+        upload_id=upload_id,
+        chunk_size=chunk_size,
+        total_chunks=_total_chunks(total_size, chunk_size)
+    ), 201
+
+
+# ---------- RECIBIR BLOQUE ----------
+@uploads_bp.route('/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_chunk(upload_id, index):
+    session = _get_session(get_db(), upload_id)
+    _require_open(session)
+
+    if index >= _total_chunks(session['total_size'], session['chunk_size']):
+        return jsonify(error='Índice de bloque fuera de rango'), 400
+
+    expected = _chunk_length(session, index)
+    offset = index * session['chunk_size']
+    written = 0
+    try:
+        fd = os.open(session['temp_path'], os.O_WRONLY)
+    except FileNotFoundError:
+        abort(404)
+    try:
+        while written < expected:
+            block = request.stream.read(min(storage.CHUNK_SIZE, expected - written))
+            if not block:
+                break
+            os.pwrite(fd, block, offset + written)
+            written += len(block)
+    finally:
+        os.close(fd)
+
+    if written != expected or request.stream.read(1):
+        return jsonify(error=f'El bloque {index} debe medir {expected} bytes'), 400
+
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO upload_chunks (upload_id, idx, size) VALUES (?, ?, ?)",
+                     (upload_id, index, written))
+        conn.execute("UPDATE upload_sessions SET updated_at=? WHERE id=?", (time.time(), upload_id))
+
+    return '', 204
+
+
+# ---------- ESTADO ----------
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@login_required
+def status(upload_id):
+    conn = get_db()
+    session = _get_session(conn, upload_id)
+    c = conn.cursor()
+    c.execute("SELECT idx, size FROM upload_chunks WHERE upload_id=? ORDER BY idx", (upload_id,))
+    chunks = c.fetchall()
+
+    total = _total_chunks(session['total_size'], session['chunk_size'])
+    received = [row['idx'] for row in chunks]
+    received_set = set(received)
+    return jsonify(
+        upload_id=upload_id,
+        state=session['state'],
+        file_id=session['file_id'],
+        filename=session['filename'],
+        size=session['total_size'],
+        chunk_size=session['chunk_size'],
+        total_chunks=total,
+        received=received,
+        missing=[i for i in range(total) if i not in received_set],
+        received_bytes=sum(row['size'] for row in chunks)
+    )
+
+
+# ---------- FINALIZAR ----------
+@uploads_bp.route('/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete(upload_id):
+    conn = get_db()
+    session = _get_session(conn, upload_id)
+    if session['state'] == 'completed':
+        return _completed(session)
+    if session['state'] != 'open':
+        return jsonify(error='La subida ya se está finalizando'), 409
+
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*) FROM upload_chunks WHERE upload_id=?", (upload_id,))
+    received = c.fetchone()[0]
+    total = _total_chunks(session['total_size'], session['chunk_size'])
+    if received != total:
+        return jsonify(error=f'Faltan {total - received} bloques'), 409
+
+    # Se reclama la sesión antes de hashear (puede tardar minutos en archivos
+    # grandes); solo una llamada llega a crear la fila en `files`
+    with transaction(conn):
+        claimed = conn.execute(
+            "UPDATE upload_sessions SET state='completing', updated_at=? WHERE id=? AND state='open'",
+            (time.time(), upload_id)
+        ).rowcount
+    if not claimed:
+        session = _get_session(conn, upload_id)
+        if session['state'] == 'completed':
+            return _completed(session)
+        return jsonify(error='La subida ya se está finalizando'), 409
+
+    try:
+        spool = storage.HashingFile.from_path(session['temp_path'])
+        file_id = storage.add_file(conn, current_user.id, current_user.username, session['filename'], spool,
+                                   datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                                   quota=current_app.config.get('USER_QUOTA_BYTES'))
+    except stats.QuotaExceeded as e:
+        _remove_session(conn, session)
+        return jsonify(error=str(e)), 413
+    except Exception:
+        # La sesión vuelve a quedar abierta para que el cliente pueda reintentar
+        with transaction(conn):
+            conn.execute("UPDATE upload_sessions SET state='open' WHERE id=?", (upload_id,))
+        raise
+
+    # El temporal ya es el blob: se conservan solo la sesión y su file_id
+    with transaction(conn):
+        conn.execute("DELETE FROM upload_chunks WHERE upload_id=?", (upload_id,))
+        conn.execute("UPDATE upload_sessions SET state='completed', file_id=?, updated_at=? WHERE id=?",
+                     (file_id, time.time(), upload_id))
+
+    search.schedule(file_id, session['filename'], storage.blob_path(spool.hexdigest()))
+    audit.record('upload', f'Archivo subido: {session["filename"]} por {current_user.username}', current_user.id)
+    return jsonify(file_id=file_id, filename=session['filename'], size=session['total_size']), 201
+
+
+# ---------- CANCELAR ----------
+@uploads_bp.route('/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel(upload_id):
+    conn = get_db()
+    session = _get_session(conn, upload_id)
+    if session['state'] == 'completing':
+        return jsonify(error='La subida ya se está finalizando'), 409
+    _remove_session(conn, session)
+    return '', 204